@@ -0,0 +1,152 @@
+import fcntl
+import logging
+import os
+import shutil
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+COPY_MODES = ("copy", "hardlink", "reflink")
+# precompressed siblings (index.html.gz) live and die with their file
+COMPRESSED_SUFFIXES = (".gz", ".br")
+# _IOW(0x94, 9, int): clone a whole file on btrfs/xfs and friends
+FICLONE = 0x40049409
+
+def asset_is_current(source_path: Path, dest_path: Path):
+    # assets are copied with their exact mtime (copystat keeps nanoseconds),
+    # so an unchanged size and mtime (or a hardlink to the same inode) means
+    # the output is up to date; whole seconds would miss a quick re-edit
+    try:
+        dest_stat = dest_path.stat()
+    except FileNotFoundError:
+        return False
+    src_stat = source_path.stat()
+    if (src_stat.st_dev, src_stat.st_ino) == (dest_stat.st_dev, dest_stat.st_ino):
+        return True
+    return src_stat.st_size == dest_stat.st_size and src_stat.st_mtime_ns == dest_stat.st_mtime_ns
+
+def copy_range(source_path: Path, dest_path: Path):
+    """
+    Copy with copy_file_range so the data never passes through user space
+    (and is shared outright on filesystems that support it).
+    """
+    with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+        remaining = os.fstat(src.fileno()).st_size
+        while remaining > 0:
+            copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+            if copied == 0:
+                break
+            remaining -= copied
+
+def reflink(source_path: Path, dest_path: Path):
+    with open(source_path, "rb") as src, open(dest_path, "wb") as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def copy_file(source_path: Path, dest_path: Path, mode: str = "copy"):
+    """
+    Copy one asset, keeping its mtime. "hardlink" and "reflink" avoid
+    copying data at all and fall back to a regular copy when the
+    filesystem can't do them.
+    """
+    assert mode in COPY_MODES, f"copy mode must be one of {COPY_MODES}"
+    if dest_path.exists() or dest_path.is_symlink():
+        # never write through an old hardlink into the source tree
+        dest_path.unlink()
+    if mode == "hardlink":
+        try:
+            os.link(source_path, dest_path)
+            return
+        except OSError:
+            pass
+    try:
+        if mode == "reflink":
+            reflink(source_path, dest_path)
+        elif hasattr(os, "copy_file_range"):
+            copy_range(source_path, dest_path)
+        else:
+            shutil.copyfile(source_path, dest_path)
+    except OSError:
+        shutil.copyfile(source_path, dest_path)
+    shutil.copystat(source_path, dest_path)
+
+def sync_assets(source_dir, dest_dir, mode: str = "copy", previous: list = None, names: dict = None):
+    """
+    Mirror source_dir into dest_dir, copying only files whose size or mtime
+    changed. names maps relative paths to the name the file gets in
+    dest_dir (its fingerprinted name). Files listed in previous (the assets
+    of the last build) that are no longer produced are removed. Returns the
+    relative output paths of every asset and the number of bytes copied.
+    """
+    source_dir = Path(source_dir)
+    dest_dir = Path(dest_dir)
+    assets = []
+    copied_bytes = 0
+    for source_path in sorted(source_dir.rglob("*")):
+        if source_path.is_dir():
+            continue
+        relative = source_path.relative_to(source_dir).as_posix()
+        if names is not None:
+            relative = names.get(relative, relative)
+        dest_path = dest_dir / relative
+        assets.append(relative)
+        if asset_is_current(source_path, dest_path):
+            continue
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        logger.debug("Copying asset: %s -> %s", source_path, dest_path)
+        copy_file(source_path, dest_path, mode)
+        copied_bytes += source_path.stat().st_size
+
+    remove_stale_assets(dest_dir, previous, assets)
+    return assets, copied_bytes
+
+def remove_stale_assets(dest_dir, previous: list, assets: list):
+    """Delete the assets of the last build (previous) that are not in assets."""
+    dest_dir = Path(dest_dir)
+    for relative in sorted(set(previous or []) - set(assets)):
+        logger.debug("Removing stale asset: %s", dest_dir / relative)
+        remove_output(dest_dir, dest_dir / relative)
+
+def prune_output(output_root, keep: set):
+    """
+    Delete every file under output_root that is not in keep (or a
+    compressed sibling of a kept file), along with directories left
+    empty. Returns the removed paths.
+    """
+    output_root = Path(output_root)
+    keep = {Path(path) for path in keep}
+    removed = []
+    for path in sorted(output_root.rglob("*"), reverse=True):
+        if path.is_dir():
+            if not any(path.iterdir()):
+                path.rmdir()
+        elif path not in keep and not (path.suffix in COMPRESSED_SUFFIXES and path.with_suffix("") in keep):
+            path.unlink()
+            removed.append(path)
+    return removed
+
+def write_if_changed(path: Path, data: str):
+    """Write a generated text file, leaving it alone (and its mtime too) if it already holds data."""
+    path = Path(path)
+    try:
+        if path.read_text(encoding="utf-8") == data:
+            return False
+    except FileNotFoundError:
+        pass
+    tmp_path = path.with_name(path.name + ".tmp")
+    tmp_path.write_text(data, encoding="utf-8")
+    os.replace(tmp_path, path)
+    return True
+
+def remove_output(output_root: Path, path: Path):
+    """Delete a generated file and any directories it leaves empty."""
+    output_root = Path(output_root)
+    if path.exists():
+        path.unlink()
+    for suffix in COMPRESSED_SUFFIXES:
+        path.with_name(path.name + suffix).unlink(missing_ok=True)
+    parent = path.parent
+    while parent != output_root and output_root in parent.parents:
+        if not parent.exists() or any(parent.iterdir()):
+            break
+        parent.rmdir()
+        parent = parent.parent
@@ -0,0 +1,365 @@
+from textnode import *
+from htmlnode import *
+from utils import *
+from blocks import *
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent
+# pages/sec depends on the machine, so the baseline is local and not committed:
+# record one with "suite --save-baseline" before changing anything, and again
+# after changing the corpus options or the machine
+BASELINE_PATH = SRC_DIR.parent / 'bench_baseline.json'
+WORDS = ("ring hobbit wizard river mountain shadow light song tale road elf dwarf "
+         "king forest tower journey fellowship council gate star sea stone").split()
+CORPUS_TEMPLATE = """<!doctype html>
+<html>
+  <head>
+    <title>{{ Title }}</title>
+    <link href="/index.css" rel="stylesheet" />
+  </head>
+  <body>
+    <nav>{{ Nav }}</nav>
+    <article>{{ Content }}</article>
+  </body>
+</html>"""
+
+def legacy_text_to_textnodes(text: str):
+    # the original five-pass chain, kept as the baseline for text_to_textnodes.
+    # The two agree on ordinary markup but not everywhere: the chain splits
+    # delimiters before links, so "_" inside a url opens italics, and it lets
+    # "[" into link and alt text
+    node = TextNode(text, TextType.TEXT)
+    nodes = split_nodes_delimiter([node], "**", TextType.BOLD)
+    nodes = split_nodes_delimiter(nodes, "_", TextType.ITALIC)
+    nodes = split_nodes_delimiter(nodes, "`", TextType.CODE)
+    nodes = split_nodes_image(nodes)
+    nodes = split_nodes_link(nodes)
+    return nodes
+
+def inline_paragraph(spans: int):
+    parts = []
+    for i in range(spans):
+        match i % 5:
+            case 0:
+                parts.append(f"see [link {i}](/pages/{i})")
+            case 1:
+                parts.append(f"run `cmd {i}`")
+            case 2:
+                parts.append(f"a **bold {i}** claim")
+            case 3:
+                parts.append(f"an _aside {i}_")
+            case 4:
+                parts.append(f"![img {i}](/images/{i}.png)")
+    return " and ".join(parts)
+
+def generate_markdown(sections: int, spans: int = 20):
+    blocks = ["# Generated document"]
+    for i in range(sections):
+        blocks.append(f"## Section {i}")
+        blocks.append(inline_paragraph(spans))
+        blocks.append("\n".join(f"- item {j} with **bold {j}**" for j in range(5)))
+        blocks.append("\n".join(f"{j + 1}. step [{j}](/steps/{j})" for j in range(3)))
+        blocks.append("```\nprint('section " + str(i) + "')\n```")
+    return "\n\n".join(blocks)
+
+class DictTextNode:
+    # attribute layout of the nodes before __slots__, for the memory comparison
+    def __init__(self, text, text_type, url=None):
+        self.text = text
+        self.text_type = text_type
+        self.url = url
+
+class DictHTMLNode:
+    def __init__(self, tag=None, value=None, children=None, props=None):
+        self.tag = tag
+        self.value = value
+        self.children = children
+        self.props = props
+
+def copy_tree(node, leaf_cls, parent_cls):
+    if node.children is None:
+        return leaf_cls(node.tag, node.value, node.props)
+    children = [copy_tree(child, leaf_cls, parent_cls) for child in node.children]
+    return parent_cls(node.tag, children, node.props)
+
+def dict_leaf(tag, value, props):
+    return DictHTMLNode(tag, value, None, props)
+
+def dict_parent(tag, children, props):
+    return DictHTMLNode(tag, None, children, props)
+
+def count_nodes(node):
+    if node.children is None:
+        return 1
+    return 1 + sum(count_nodes(child) for child in node.children)
+
+def measure_retained(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, after - before
+
+def bench_memory(sections: int = 2000):
+    # each comparison copies an existing set of nodes, so strings and props
+    # are shared and only the per-node overhead is measured
+    markdown = generate_markdown(sections)
+    print(f"document: {len(markdown) / 1e6:.1f} MB of markdown")
+
+    text_nodes = text_to_textnodes(inline_paragraph(sections * 10))
+    count = len(text_nodes)
+    _, slotted = measure_retained(
+        lambda: [TextNode(n.text, n.text_type, n.url) for n in text_nodes])
+    _, unslotted = measure_retained(
+        lambda: [DictTextNode(n.text, n.text_type, n.url) for n in text_nodes])
+    print(f"TextNode: {count} nodes, {slotted / count:.0f} B/node with __slots__, "
+          f"{unslotted / count:.0f} B/node with __dict__")
+
+    tree = markdown_to_html_node(markdown)
+    count = count_nodes(tree)
+    _, slotted = measure_retained(lambda: copy_tree(tree, LeafNode, ParentNode))
+    _, unslotted = measure_retained(lambda: copy_tree(tree, dict_leaf, dict_parent))
+    print(f"HTMLNode tree: {count} nodes, {slotted / count:.0f} B/node with __slots__, "
+          f"{unslotted / count:.0f} B/node with __dict__ "
+          f"({(unslotted - slotted) / 1e6:.1f} MB saved)")
+
+def time_call(fn, arg, repeat: int = 5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def bench_inline(sizes=(10, 100, 500, 2000)):
+    print(f"{'spans':>6} {'legacy (ms)':>12} {'single pass (ms)':>17} {'speedup':>8}")
+    for size in sizes:
+        text = inline_paragraph(size)
+        try:
+            legacy = time_call(legacy_text_to_textnodes, text)
+            legacy_text = f"{legacy * 1000:12.2f}"
+        except RecursionError:
+            legacy = None
+            legacy_text = f"{'recursion':>12}"
+        current = time_call(text_to_textnodes, text)
+        speedup = f"{legacy / current:7.1f}x" if legacy else f"{'-':>8}"
+        print(f"{size:>6} {legacy_text} {current * 1000:17.2f} {speedup}")
+
+class CorpusSpec:
+    """Shape of a synthetic content tree for the benchmark suite."""
+    def __init__(self, pages: int = 500, blocks: int = 12, paragraph_words: int = 80,
+                 link_density: float = 0.04, emphasis_density: float = 0.06,
+                 list_ratio: float = 0.2, code_ratio: float = 0.1, seed: int = 0):
+        self.pages = pages
+        self.blocks = blocks
+        self.paragraph_words = paragraph_words
+        self.link_density = link_density
+        self.emphasis_density = emphasis_density
+        self.list_ratio = list_ratio
+        self.code_ratio = code_ratio
+        self.seed = seed
+
+    def as_dict(self):
+        return dict(vars(self))
+
+def synthetic_text(rng: random.Random, spec: CorpusSpec, words: int):
+    parts = []
+    for _ in range(words):
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < spec.link_density:
+            parts.append(f"[{word}](/section{rng.randrange(10)}/page{rng.randrange(spec.pages)}/)")
+        elif roll < spec.link_density + spec.emphasis_density:
+            parts.append(rng.choice(("**{}**", "_{}_", "`{}`")).format(word))
+        else:
+            parts.append(word)
+    return " ".join(parts)
+
+def synthetic_page(rng: random.Random, spec: CorpusSpec, title: str):
+    blocks = [f"# {title}"]
+    for i in range(spec.blocks):
+        if i % 4 == 3:
+            blocks.append(f"## {synthetic_text(rng, spec, 4)}")
+        roll = rng.random()
+        if roll < spec.list_ratio:
+            items = [synthetic_text(rng, spec, 8) for _ in range(rng.randint(2, 6))]
+            if rng.random() < 0.5:
+                blocks.append("\n".join(f"- {item}" for item in items))
+            else:
+                blocks.append("\n".join(f"{n}. {item}" for n, item in enumerate(items, 1)))
+        elif roll < spec.list_ratio + spec.code_ratio:
+            lines = [f"{rng.choice(WORDS)} = {rng.randrange(1000)}" for _ in range(rng.randint(2, 8))]
+            blocks.append("```\n" + "\n".join(lines) + "\n```")
+        else:
+            blocks.append(synthetic_text(rng, spec, spec.paragraph_words))
+    return "\n\n".join(blocks)
+
+def generate_corpus(root, spec: CorpusSpec):
+    """Write content/, static/ and template.html for a synthetic site under root."""
+    root = Path(root)
+    rng = random.Random(spec.seed)
+    content = root / "content"
+    content.mkdir(parents=True)
+    (content / "index.md").write_text(synthetic_page(rng, spec, "Home"))
+    for i in range(1, spec.pages):
+        page_dir = content / f"section{i % 10}" / f"page{i}"
+        page_dir.mkdir(parents=True)
+        (page_dir / "index.md").write_text(synthetic_page(rng, spec, f"Page {i}"))
+    for i in range(10):
+        (content / f"section{i}").mkdir(exist_ok=True)
+        (content / f"section{i}" / "index.md").write_text(f"# Section {i}\n\n" + synthetic_text(rng, spec, 40))
+    (root / "static").mkdir()
+    (root / "static" / "index.css").write_text("body { margin: 0 auto; max-width: 40em; }")
+    (root / "template.html").write_text(CORPUS_TEMPLATE)
+    return sorted(content.rglob("*.md"))
+
+def best_time(fn, repeat: int = 3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def time_build(root, argv: list = ()):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, str(SRC_DIR / "main.py"), *argv], cwd=root,
+                   stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+def run_suite(spec: CorpusSpec, repeat: int = 3):
+    """Time each pipeline stage over a synthetic corpus; returns seconds per stage."""
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = [path.read_text() for path in generate_corpus(tmp, spec)]
+        paragraphs = [" ".join(lines) for source in sources
+                      for block_type, lines in lex_blocks(source) if block_type == BlockType.PARAGRAPH]
+        trees = [markdown_to_html_node(source) for source in sources]
+        seconds = {
+            "markdown_to_html_node": best_time(lambda: [markdown_to_html_node(s) for s in sources], repeat),
+            "text_to_textnodes": best_time(lambda: [text_to_textnodes(p) for p in paragraphs], repeat),
+            "ParentNode.to_html": best_time(lambda: [tree.to_html() for tree in trees], repeat),
+            "main() build": min(time_build(tmp) for _ in range(repeat)),
+        }
+    return len(sources), seconds
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return own / 1024, children / 1024
+
+def compare_to_baseline(results: dict, spec: CorpusSpec, baseline_path: Path, tolerance: float):
+    """
+    Return the names of stages whose pages/sec fell more than tolerance
+    below the baseline, or None if there is no baseline for this corpus.
+    """
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; run with --save-baseline to record one")
+        return None
+    with open(baseline_path, "r") as f:
+        baseline = json.load(f)
+    if baseline.get("corpus") != spec.as_dict():
+        print(f"baseline at {baseline_path} was recorded for a different corpus; "
+              "run with --save-baseline to record one for this corpus")
+        return None
+    regressions = []
+    print(f"{'stage':<24} {'pages/s':>10} {'baseline':>10} {'change':>8}")
+    for name, pages_per_sec in results.items():
+        expected = baseline["pages_per_sec"].get(name)
+        if expected is None:
+            continue
+        change = pages_per_sec / expected - 1
+        flag = ""
+        if change < -tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<24} {pages_per_sec:10.0f} {expected:10.0f} {change:+7.0%}{flag}")
+    return regressions
+
+def bench_suite(args=None):
+    args = args or parse_args([])
+    spec = CorpusSpec(args.pages, args.blocks, args.paragraph_words, args.link_density,
+                      args.emphasis_density, args.list_ratio, args.code_ratio, args.seed)
+    pages, seconds = run_suite(spec, args.repeat)
+    results = {name: pages / elapsed for name, elapsed in seconds.items()}
+    print(f"corpus: {pages} pages")
+    print(f"{'stage':<24} {'seconds':>10} {'pages/s':>10}")
+    for name, elapsed in seconds.items():
+        print(f"{name:<24} {elapsed:10.3f} {results[name]:10.0f}")
+    own_rss, build_rss = peak_rss_mb()
+    print(f"peak RSS: {own_rss:.0f} MB in-process, {build_rss:.0f} MB for the build")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump({"corpus": spec.as_dict(), "pages_per_sec": results}, f, indent=1)
+        print(f"baseline saved to {args.baseline}")
+        return 0
+    regressions = compare_to_baseline(results, spec, args.baseline, args.tolerance)
+    if regressions is None:
+        # nothing to gate on is a failure too, so a lost baseline can't go unnoticed
+        return 2
+    if regressions:
+        print(f"regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+BENCHMARKS = {
+    "inline": lambda args: bench_inline(),
+    "memory": lambda args: bench_memory(),
+    "suite": bench_suite,
+}
+# the suite gates on the baseline, so it only runs when asked for by name
+DEFAULT_BENCHMARKS = ("inline", "memory")
+
+def parse_args(argv=None):
+    defaults = CorpusSpec()
+    parser = argparse.ArgumentParser(description="Benchmarks for the site generator")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"which benchmarks to run: {', '.join(BENCHMARKS)} "
+                             f"(default: {', '.join(DEFAULT_BENCHMARKS)})")
+    parser.add_argument("--pages", type=int, default=defaults.pages)
+    parser.add_argument("--blocks", type=int, default=defaults.blocks, help="blocks per page")
+    parser.add_argument("--paragraph-words", type=int, default=defaults.paragraph_words)
+    parser.add_argument("--link-density", type=float, default=defaults.link_density,
+                        help="fraction of words that are links")
+    parser.add_argument("--emphasis-density", type=float, default=defaults.emphasis_density,
+                        help="fraction of words that are bold, italic or code")
+    parser.add_argument("--list-ratio", type=float, default=defaults.list_ratio,
+                        help="fraction of blocks that are lists")
+    parser.add_argument("--code-ratio", type=float, default=defaults.code_ratio,
+                        help="fraction of blocks that are code blocks")
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per stage; the best is kept")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="record this run as the baseline instead of comparing against it")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed pages/sec drop versus the baseline before failing")
+    args = parser.parse_args(argv)
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark {name!r}")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    status = 0
+    for name in args.benchmarks or DEFAULT_BENCHMARKS:
+        print(f"== {name}")
+        status = max(status, BENCHMARKS[name](args) or 0)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
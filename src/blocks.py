@@ -4,6 +4,10 @@ from textnode import *
 from htmlnode import *
 from utils import *
 
+# bump whenever a parser change alters the node tree built from the same
+# markdown, so cached trees from older versions are not reused
+PARSER_VERSION = 2
+
 class BlockType(Enum):
     PARAGRAPH = "paragraph"
     HEADING = "heading"
@@ -12,58 +16,82 @@ class BlockType(Enum):
     UNORDERED_LIST = "unordered_list"
     ORDERED_LIST = "ordered_list"
 
-def check_all_lines(pattern: str):
-    def checker(block: str):
-        lines = block.split('\n')
-        return all(re.match(pattern, line) for line in lines)
-    return checker
-
-def is_quote(block: str):
-    quote_re = r"^>.*"
-    return check_all_lines(quote_re)(block)
-
-def is_ul(block: str):
-    ul_re = r"^-\s.*"
-    return check_all_lines(ul_re)(block)
-
-def is_heading(block: str):
-    headers_re = r"^\#{1,6}\s.*"
-    return re.match(headers_re, block) is not None
+HEADING_RE = re.compile(r"#{1,6}\s")
+HEADING_CONTENT_RE = re.compile(r"#+\s+(.*)")
+UL_LINE_RE = re.compile(r"-\s")
 
-def is_code(block: str):
-    lines = block.split('\n')
-    return len(lines) >= 2 and lines[0] == "```" and lines[-1] == "```"
-
-def is_ol(block: str):
-    lines = block.split('\n')
-    for i, line in enumerate(lines):
-        expected = i+1
-        if not line.startswith(f"{expected}. "):
-            return False
-    return True
-
-def block_to_blocktype(block: str):
-    if is_heading(block):
+def lines_to_blocktype(lines: list):
+    """
+    Classify a block from its lines, checking the quote, ordered list and
+    unordered list rules together in a single scan.
+    """
+    if HEADING_RE.match(lines[0]):
         return BlockType.HEADING
-    elif is_code(block):
+    if len(lines) >= 2 and lines[0] == "```" and lines[-1] == "```":
         return BlockType.CODE
-    elif is_quote(block):
+    quote = ol = ul = True
+    for i, line in enumerate(lines, 1):
+        quote = quote and line.startswith(">")
+        ol = ol and line.startswith(f"{i}. ")
+        ul = ul and UL_LINE_RE.match(line) is not None
+        if not (quote or ol or ul):
+            return BlockType.PARAGRAPH
+    if quote:
         return BlockType.QUOTE
-    elif is_ol(block):
+    elif ol:
         return BlockType.ORDERED_LIST
-    elif is_ul(block):
-        return BlockType.UNORDERED_LIST
     else:
-        return BlockType.PARAGRAPH
+        return BlockType.UNORDERED_LIST
+
+def block_to_blocktype(block: str):
+    return lines_to_blocktype(block.split('\n'))
     
-def markdown_to_blocks(markdown: str):
-    blocks = markdown.split('\n\n')
-    new_blocks = []
-    for block in blocks:
+def markdown_to_blocks(markdown):
+    """
+    Yield the stripped, non-empty blocks of markdown one at a time.
+    markdown is either a string or an iterable of lines (an open file, a
+    memory map), which is consumed lazily so only the current block is
+    ever held in memory.
+    """
+    if isinstance(markdown, str):
+        for block in markdown.split('\n\n'):
+            block = block.strip()
+            if block:
+                yield block
+        return
+    # the same split as above, line by line: a blank line ends a block when
+    # the newline before it is not already part of the previous separator
+    chunk = []
+    for line in markdown:
+        if line == '\n' and chunk:
+            block = "".join(chunk).strip()
+            chunk = []
+            if block:
+                yield block
+        else:
+            chunk.append(line)
+    block = "".join(chunk).strip()
+    if block:
+        yield block
+
+def lex_blocks(markdown: str):
+    """
+    Split markdown into blocks and classify each one exactly once,
+    returning (BlockType, lines) records.
+    """
+    records = []
+    for block in markdown.split('\n\n'):
         block = block.strip()
         if block:
-            new_blocks.append(block)
-    return new_blocks
+            lines = block.split('\n')
+            records.append((lines_to_blocktype(lines), lines))
+    return records
+
+def heading_line_content(line: str):
+    match = HEADING_CONTENT_RE.match(line)
+    if match:
+        return match.group(1)
+    return line
 
 def extract_heading_content(block: str):
     pattern = r'^#+\s+(.*)'
@@ -72,100 +100,105 @@ def extract_heading_content(block: str):
         return match.group(1)
     return block
 
+def code_lines_content(lines: list):
+    return "\n".join(lines[1:-1]) + '\n'
+
 def extract_code_content(block: str):
     assert block_to_blocktype(block) == BlockType.CODE, "Must be a code block to get code content"
-    return "\n".join(block.split('\n')[1:-1]) + '\n'
+    return code_lines_content(block.split('\n'))
+
+def quote_lines_content(lines: list):
+    return ' '.join(line[2:].strip() for line in lines)
 
 def extract_quote_content(block: str):
     assert block_to_blocktype(block) == BlockType.QUOTE, "Must be a quote block to get quote content"
-    lines = block.split('\n')
-    result = []
-    for line in lines:
-        result.append(line[2:].strip())
-    return ' '.join(result)
+    return quote_lines_content(block.split('\n'))
 
-def extract_ul_nodes(block: str):
-    assert block_to_blocktype(block) == BlockType.UNORDERED_LIST, "Must be an unordered list block to get li items"
-    list_items = []
-    lines = block.split('\n')
+def ul_item_content(line: str):
+    return line.strip()[2:].strip() # remove leading "- "
+
+def ol_item_content(line: str):
+    return line.strip().partition(". ")[2].strip() # remove leading "1. "
 
+def list_item_nodes(lines: list, item_content, resolve_url=None):
+    list_items = []
     for line in lines:
         if not line.strip():
             continue
-
-        content = line.strip()[2:].strip() # remove leading "- "
-        child_nodes = text_to_children(content)
-        li_node = ParentNode(tag="li", children=child_nodes)
-        list_items.append(li_node)
-
+        child_nodes = text_to_children(item_content(line), resolve_url)
+        list_items.append(ParentNode(tag="li", children=child_nodes))
     return list_items
 
+def extract_ul_nodes(block: str):
+    assert block_to_blocktype(block) == BlockType.UNORDERED_LIST, "Must be an unordered list block to get li items"
+    return list_item_nodes(block.split('\n'), ul_item_content)
+
 def extract_ol_nodes(block: str):
     assert block_to_blocktype(block) == BlockType.ORDERED_LIST, "Must be an ordered list block to get li items"
-    list_items = []
-    lines = block.split('\n')
+    return list_item_nodes(block.split('\n'), ol_item_content)
 
-    for line in lines:
-        if not line.strip():
-            continue
-
-        content = line.strip()[3:].strip() # remove leading "1. "
-        child_nodes = text_to_children(content)
-        li_node = ParentNode(tag="li", children=child_nodes)
-        list_items.append(li_node)
-
-    return list_items
+def heading_lines_tag(lines: list):
+    level = len(lines[0]) - len(lines[0].lstrip('#'))
+    return f"h{level}"
 
 def get_heading_block_tag(block: str):
     assert block_to_blocktype(block) == BlockType.HEADING, "Must be heading block to get heading tag"
-    pattern = r'^(#+)'
-    match = re.match(pattern, block)
-    num = 1
-    if match:
-        num = len(match.group(1))
-    return f"h{num}"
+    return heading_lines_tag(block.split('\n'))
 
-def text_to_children(text: str):
+def text_to_children(text: str, resolve_url=None):
+    if not has_inline_markup(text):
+        return [LeafNode(None, text)] if text else []
     text_nodes = text_to_textnodes(text)
     html_nodes = []
     for tnode in text_nodes:
-        html_nodes.append( text_node_to_html_node(tnode) )
+        html_nodes.append( text_node_to_html_node(tnode, resolve_url) )
     return html_nodes
 
-def markdown_to_html_node(markdown: str):
-    blocks = markdown_to_blocks(markdown)
-    nodes = []
+def block_to_html_node(block_type: BlockType, lines: list, resolve_url=None):
+    match block_type:
+        case BlockType.PARAGRAPH:
+            child_nodes = text_to_children(' '.join(lines), resolve_url)
+            return ParentNode(tag="p", children=child_nodes)
+        case BlockType.HEADING:
+            child_nodes = text_to_children(heading_line_content(lines[0]), resolve_url)
+            return ParentNode(tag=heading_lines_tag(lines), children=child_nodes)
+        case BlockType.CODE:
+            code_node = LeafNode("code", code_lines_content(lines))
+            return ParentNode(tag="pre", children=[code_node])
+        case BlockType.QUOTE:
+            child_nodes = text_to_children(quote_lines_content(lines), resolve_url)
+            return ParentNode(tag="blockquote", children=child_nodes)
+        case BlockType.UNORDERED_LIST:
+            return ParentNode(tag="ul", children=list_item_nodes(lines, ul_item_content, resolve_url))
+        case BlockType.ORDERED_LIST:
+            return ParentNode(tag="ol", children=list_item_nodes(lines, ol_item_content, resolve_url))
+        case _:
+            raise Exception("invalid block type")
+
+def blocks_to_html_node(records: list, resolve_url=None):
+    return ParentNode(tag="div", children=[block_to_html_node(block_type, lines, resolve_url) for block_type, lines in records])
+
+def iter_blocks_html(blocks, resolve_url=None, minify: bool = False, visit=None):
+    """
+    The html of markdown_to_html_node, rendered lazily from an iterable of
+    blocks (see markdown_to_blocks) one block at a time. minify runs
+    minify_node over each block, and visit, if given, is called with each
+    block's node.
+    """
+    yield "<div>"
     for block in blocks:
-        block_type = block_to_blocktype(block)
-        match block_type:
-            case BlockType.PARAGRAPH:
-                clean_block = block.replace('\n',' ')
-                child_nodes = text_to_children(clean_block)
-                this_node = ParentNode(tag="p",children=child_nodes)
-                nodes.append(this_node)
-            case BlockType.HEADING:
-                tag = get_heading_block_tag(block)
-                child_nodes = text_to_children(extract_heading_content(block))
-                this_node = ParentNode(tag=tag, children=child_nodes)
-                nodes.append(this_node)
-            case BlockType.CODE:
-                content = extract_code_content(block)
-                code_node = LeafNode("code", content)
-                pre_node = ParentNode(tag="pre", children=[code_node])
-                nodes.append(pre_node)
-            case BlockType.QUOTE:
-                quote_content = extract_quote_content(block)
-                child_nodes = text_to_children(quote_content)
-                this_node = ParentNode(tag="blockquote", children=child_nodes)
-                nodes.append(this_node)
-            case BlockType.UNORDERED_LIST:
-                li_nodes = extract_ul_nodes(block)
-                ul_node = ParentNode(tag="ul", children=li_nodes)
-                nodes.append(ul_node)
-            case BlockType.ORDERED_LIST:
-                li_nodes = extract_ol_nodes(block)
-                ol_node = ParentNode(tag="ol", children=li_nodes)
-                nodes.append(ol_node)
-            case _:
-                raise Exception("invalid block type")
-    return ParentNode(tag="div", children=nodes)
\ No newline at end of file
+        lines = block.split('\n')
+        node = block_to_html_node(lines_to_blocktype(lines), lines, resolve_url)
+        if minify:
+            minify_node(node)
+        if visit is not None:
+            visit(node)
+        yield from node.iter_html()
+    yield "</div>"
+
+def markdown_to_html_node(markdown: str, resolve_url=None):
+    """
+    resolve_url, when given, is applied to every link href and image src
+    (see utils.UrlResolver).
+    """
+    return blocks_to_html_node(lex_blocks(markdown), resolve_url)
@@ -0,0 +1,702 @@
+from textnode import *
+from htmlnode import *
+from utils import *
+from blocks import *
+from assets import *
+from manifest import *
+from cache import *
+from template import *
+from profiler import *
+from pipeline import *
+from depgraph import *
+from fingerprint import *
+from images import *
+from search import *
+import datetime
+import hashlib
+import html
+import logging
+import mmap
+import multiprocessing
+import time
+import os
+import shutil
+from pathlib import Path
+
+CONTENT_DIR = Path('content')
+STATIC_DIR = Path('static')
+TEMPLATE_PATH = Path('template.html')
+OUTPUT_DIR = Path('docs')
+MANIFEST_PATH = Path('.cache') / 'manifest.json'
+AST_CACHE_DIR = Path('.cache') / 'ast'
+# sources at least this large are rendered block by block from a memory map
+STREAM_THRESHOLD = 32 * 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+def clean_and_copy(sourcepath: Path, destpath: Path, mode: str = "copy"):
+    assert sourcepath.exists(), f"Source path {sourcepath} does not exist"
+
+    # see if the destination path exists, if not, make it along with parent dirs
+    if not destpath.exists():
+        destpath.mkdir(parents=True)
+        
+    if sourcepath.is_file():
+        logger.debug("Copying file: %s -> %s", sourcepath, destpath)
+        copy_file(sourcepath, destpath / sourcepath.name, mode)
+    else:
+        logger.debug("Copying directory contents: %s -> %s", sourcepath, destpath)
+        sync_assets(sourcepath, destpath, mode)
+
+def extract_title(markdown: str):
+    assert get_heading_block_tag(markdown) == "h1", "title must be of type <h1>"
+    return extract_heading_content(markdown)
+
+def extract_description(node: HTMLNode, max_length: int = 160):
+    """Plain text of the page's first paragraph, shortened at a word boundary."""
+    for child in node.children:
+        if child.tag == "p":
+            text = "".join(leaf_text(child))
+            if len(text) > max_length:
+                text = text[:max_length].rsplit(" ", 1)[0] + "..."
+            return html.escape(text)
+    return ""
+
+def page_date(mtime: float):
+    return datetime.date.fromtimestamp(mtime).isoformat()
+
+def build_nav(dir_path_content, resolve_url=None):
+    """A list of links to every top-level section that has an index.md."""
+    items = []
+    for path in sorted(Path(dir_path_content).iterdir()):
+        index = path / "index.md"
+        if path.is_dir() and index.is_file():
+            with open(index, "r") as source:
+                first_line = source.readline().strip()
+            title = heading_line_content(first_line) if first_line.startswith("# ") else path.name
+            href = f"/{path.name}/"
+            link = LeafNode("a", title, {"href": resolve_url(href) if resolve_url else href})
+            items.append(ParentNode("li", [link]))
+    return ParentNode("ul", items).to_html()
+
+class RenderOptions:
+    """
+    Optional transformations applied to every page of a build. fingerprints
+    (see fingerprint_assets) points asset urls at fingerprinted names and
+    images (see plan_images) gives img elements their size and srcset.
+    search_index collects every page's terms for write_search_index,
+    stemmed with search_stem.
+    """
+    __slots__ = ("minify", "fingerprints", "images", "search_index", "search_stem")
+
+    def __init__(self, minify: bool = False, fingerprints: AssetFingerprints = None,
+                 images: ResponsiveImages = None, search_index: bool = False, search_stem: bool = False):
+        self.minify = minify
+        self.fingerprints = fingerprints
+        self.images = images
+        self.search_index = search_index
+        self.search_stem = search_stem
+
+    @property
+    def key(self):
+        # recorded in the manifest, so changing an option rebuilds the pages;
+        # the names and sizes of single assets are recorded with the pages
+        # that show them (see asset_states)
+        return {"minify": self.minify,
+                "fingerprints": self.fingerprints is not None,
+                "images": self.images.sizes if self.images is not None else None,
+                "search_index": self.search_index,
+                "search_stem": self.search_index and self.search_stem}
+
+    def page_document(self):
+        """An empty PageDocument for a page to fill in, or None without search_index."""
+        return PageDocument(stemmed=self.search_stem) if self.search_index else None
+
+def read_page(from_path, profiler: BuildProfiler = None):
+    """The page's markdown and its date, taken from the file's mtime."""
+    if profiler is None:
+        profiler = NullProfiler()
+    with profiler.stage("read", str(from_path)):
+        with open(from_path, "r") as source:
+            return source.read(), page_date(os.fstat(source.fileno()).st_mtime)
+
+def render_page(from_path, source_text: str, date: str, template_path, basepath: str,
+                cache: ASTCache = None, values: dict = None, profiler: BuildProfiler = None,
+                options: RenderOptions = None, document: PageDocument = None):
+    """
+    Render a page's markdown into its template, returning the html in
+    chunks. document, if given, gets the page's title and terms.
+    """
+    if profiler is None:
+        profiler = NullProfiler()
+    if options is None:
+        options = RenderOptions()
+    page = str(from_path)
+
+    resolve_url = UrlResolver(basepath, options.fingerprints, options.images)
+    source_node = None
+    if cache is not None:
+        with profiler.stage("cache", page):
+            source_node = cache.get(source_text, resolve_url)
+    if source_node is None:
+        with profiler.stage("block split", page):
+            blocks = lex_blocks(source_text)
+        with profiler.stage("inline parse", page):
+            source_node = blocks_to_html_node(blocks, resolve_url)
+        if cache is not None:
+            with profiler.stage("cache", page):
+                cache.put(source_text, source_node, resolve_url)
+
+    if options.minify:
+        # after the cache, which keeps the tree as parsed
+        with profiler.stage("minify", page):
+            minify_node(source_node)
+
+    if document is not None:
+        with profiler.stage("search index", page):
+            document.add_page(source_node)
+
+    with profiler.stage("serialize", page):
+        body_chunks = list(source_node.iter_html())
+
+    with profiler.stage("template", page):
+        template = load_template(template_path, basepath, options.minify, options.fingerprints)
+        title = extract_title(source_text)
+        if document is not None:
+            document.title = title
+        page_values = dict(values or {})
+        page_values.update({
+            "Title": title,
+            "Content": body_chunks,
+            "Description": extract_description(source_node),
+            "Date": date,
+        })
+        return list(template.iter_render(page_values))
+
+def write_page(from_path, dest_path, page_chunks: list, profiler: BuildProfiler = None,
+               skip_unchanged: bool = False, previous_hash: str = None):
+    """
+    Write the rendered page, returning the number of bytes written and, with
+    skip_unchanged, the hash of the html. In that mode a file that already
+    holds exactly this html is left alone (keeping its mtime) and 0 bytes
+    are reported.
+    """
+    if profiler is None:
+        profiler = NullProfiler()
+    with profiler.stage("write", str(from_path)):
+        return write_chunks(dest_path, page_chunks, skip_unchanged, previous_hash)
+
+def write_chunks(dest_path, chunks, skip_unchanged: bool = False, previous_hash: str = None):
+    """
+    Write chunks of html to a temp file beside dest_path, encoding them one
+    at a time (and hashing them on the way, with skip_unchanged), then move
+    it into place, so the page is never held whole. Returns what write_page
+    does; a dest_path the same size as the new html counts as unchanged if
+    previous_hash, or the file's own hash, matches.
+    """
+    dest_path = Path(dest_path)
+    digest = hashlib.sha256() if skip_unchanged else None
+    written = 0
+    tmp_path = dest_path.with_name(dest_path.name + ".tmp")
+    with open(tmp_path, "wb") as output:
+        for chunk in chunks:
+            data = chunk.encode()
+            if digest is not None:
+                digest.update(data)
+            output.write(data)
+            written += len(data)
+    if digest is None:
+        os.replace(tmp_path, dest_path)
+        return written, None
+    digest = digest.hexdigest()
+    if os.path.exists(dest_path) and os.path.getsize(dest_path) == written:
+        if (previous_hash or hash_file(dest_path)) == digest:
+            os.unlink(tmp_path)
+            return 0, digest
+    os.replace(tmp_path, dest_path)
+    return written, digest
+
+def mapped_lines(mapped: mmap.mmap):
+    """The lines of a memory-mapped source, with newlines read as text mode would."""
+    mapped.seek(0)
+    for line in iter(mapped.readline, b""):
+        line = line.decode()
+        yield line[:-2] + "\n" if line.endswith("\r\n") else line
+
+def stream_page(from_path, template_path, dest_path, basepath: str, values: dict = None,
+                profiler: BuildProfiler = None, skip_unchanged: bool = False, previous_hash: str = None,
+                options: RenderOptions = None, document: PageDocument = None):
+    """
+    Render a very large page straight from a memory map of its source into
+    the output file, one block at a time, so memory use is bounded by the
+    largest block rather than the file. The AST cache is not used. Returns
+    the same (bytes written, hash) as write_page.
+    """
+    if profiler is None:
+        profiler = NullProfiler()
+    if options is None:
+        options = RenderOptions()
+    page = str(from_path)
+    dest_path = Path(dest_path)
+    resolve_url = UrlResolver(basepath, options.fingerprints, options.images)
+    with open(from_path, "rb") as source, mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        date = page_date(os.fstat(source.fileno()).st_mtime)
+        # the title and description come before the content in the template,
+        # so look for them first; this only reads up to the first paragraph
+        with profiler.stage("block split", page):
+            blocks = markdown_to_blocks(mapped_lines(mapped))
+            title = extract_title(next(blocks, ""))
+            if document is not None:
+                document.title = title
+            description = ""
+            for block in blocks:
+                lines = block.split("\n")
+                if lines_to_blocktype(lines) == BlockType.PARAGRAPH:
+                    paragraph = block_to_html_node(BlockType.PARAGRAPH, lines, resolve_url)
+                    if options.minify:
+                        minify_node(paragraph)
+                    description = extract_description(ParentNode("div", [paragraph]))
+                    break
+
+        with profiler.stage("stream", page):
+            template = load_template(template_path, basepath, options.minify, options.fingerprints)
+            page_values = dict(values or {})
+            page_values.update({
+                "Title": title,
+                "Content": iter_blocks_html(markdown_to_blocks(mapped_lines(mapped)), resolve_url, options.minify,
+                                            document.add_block if document is not None else None),
+                "Description": description,
+                "Date": date,
+            })
+            # rendered as it is written, while the source is still mapped
+            return write_chunks(dest_path, template.iter_render(page_values), skip_unchanged, previous_hash)
+
+def generate_page(from_path: str, template_path: str, dest_path: str, basepath: str,
+                  cache: ASTCache = None, values: dict = None, profiler: BuildProfiler = None,
+                  skip_unchanged: bool = False, stream_threshold: int = STREAM_THRESHOLD,
+                  options: RenderOptions = None):
+    logger.debug("Generating page %s -> %s using %s", from_path, dest_path, template_path)
+    if os.path.getsize(from_path) >= stream_threshold:
+        written, _ = stream_page(from_path, template_path, dest_path, basepath, values, profiler, skip_unchanged,
+                                 options=options)
+        return written
+    source_text, date = read_page(from_path, profiler)
+    page_chunks = render_page(from_path, source_text, date, template_path, basepath, cache, values, profiler,
+                              options)
+    written, _ = write_page(from_path, dest_path, page_chunks, profiler, skip_unchanged)
+    return written
+
+def collect_page_jobs(dir_path_content, dest_dir_path, exist_ok: bool = False):
+    """
+    Walk the content tree, creating the matching output directories, and
+    return a sorted list of (markdown source, html destination) pairs.
+    """
+    content_path = Path(dir_path_content)
+    dest_path = Path(dest_dir_path)
+    jobs = []
+
+    for path in sorted(content_path.iterdir()):
+        new_dest_path = dest_path / path.name
+        if path.is_dir():
+            logger.debug("Making dest path: %s", new_dest_path)
+            new_dest_path.mkdir(exist_ok=exist_ok)
+            jobs.extend(collect_page_jobs(path, new_dest_path, exist_ok))
+        elif path.is_file() and str(path).endswith('.md'):
+            dest_filepath = new_dest_path.parent / (new_dest_path.stem + '.html')
+            jobs.append((path, dest_filepath))
+    return jobs
+
+class PageBuildError(Exception):
+    def __init__(self, failures: list):
+        self.failures = failures
+        lines = [f"{len(failures)} page(s) failed to build:"]
+        lines.extend(f"  {source}: {error}" for source, error in failures)
+        super().__init__("\n".join(lines))
+
+class BuildSummary:
+    def __init__(self):
+        self.pages_built = 0
+        self.pages_skipped = 0
+        self.pages_unchanged = 0
+        self.bytes_written = 0
+        self.assets = 0
+        self.asset_bytes = 0
+        self.seconds = 0.0
+        self.outputs = []
+        self.documents = {}
+
+    def __str__(self):
+        return (f"Built {self.pages_built} pages ({self.pages_skipped} skipped, {self.pages_unchanged} identical, "
+                f"{format_bytes(self.bytes_written)} written), synced {self.assets} assets "
+                f"({format_bytes(self.asset_bytes)} copied) in {self.seconds:.2f}s")
+
+def format_bytes(count: int):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024:
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} GB"
+
+class PageJob:
+    """Everything needed to render one page, including in a worker process."""
+    __slots__ = ("source", "template", "dest", "basepath", "cache", "values", "profile", "skip_unchanged",
+                 "output_hash", "options")
+
+    def __init__(self, source: Path, template: Path, dest: Path, basepath: str,
+                 cache: ASTCache = None, values: dict = None, profile: bool = False,
+                 skip_unchanged: bool = False, output_hash: str = None, options: RenderOptions = None):
+        self.source = source
+        self.template = template
+        self.dest = dest
+        self.basepath = basepath
+        self.cache = cache
+        self.values = values
+        self.profile = profile
+        self.skip_unchanged = skip_unchanged
+        self.output_hash = output_hash
+        self.options = options
+
+# The three stages of run_page_jobs. Each one passes its profiler stats on
+# to the next so a page's timings arrive together with its result.
+
+def read_page_job(job: PageJob):
+    if os.path.getsize(job.source) >= STREAM_THRESHOLD:
+        # too big to hold in memory; the render stage streams it instead
+        return None, None, None
+    profiler = BuildProfiler() if job.profile else None
+    source_text, date = read_page(job.source, profiler)
+    return source_text, date, profiler.pages if profiler else None
+
+def render_page_job(job: PageJob, data: tuple):
+    # may run inside a worker process, so errors are returned instead of
+    # raised (not every exception survives pickling)
+    source_text, date, stats = data
+    logger.debug("Generating page %s -> %s using %s", job.source, job.dest, job.template)
+    profiler = BuildProfiler() if job.profile else None
+    if profiler is not None and stats:
+        profiler.merge(stats)
+    document = job.options.page_document() if job.options is not None else None
+    try:
+        if source_text is None:
+            result = stream_page(job.source, job.template, job.dest, job.basepath, job.values, profiler,
+                                 job.skip_unchanged, job.output_hash, job.options, document)
+            return None, result, profiler.pages if profiler else None, document and document.to_json()
+        chunks = render_page(job.source, source_text, date, job.template, job.basepath, job.cache,
+                             job.values, profiler, job.options, document)
+        if multiprocessing.parent_process() is not None:
+            # one string pickles far faster than thousands of small ones; in
+            # this process the chunks go to write_page as they are
+            chunks = ["".join(chunks)]
+    except Exception as e:
+        return f"{type(e).__name__}: {e}", None, None, None
+    finally:
+        if multiprocessing.parent_process() is not None:
+            # worker processes exit without flushing buffered log records
+            for handler in logging.getLogger().handlers:
+                handler.flush()
+    return None, chunks, profiler.pages if profiler else None, document and document.to_json()
+
+def write_page_job(job: PageJob, rendered: tuple):
+    error, html, stats, document = rendered
+    if error is not None:
+        return error, 0, None, None, None
+    if isinstance(html, tuple):
+        # streamed pages are already written
+        return None, *html, stats, document
+    profiler = BuildProfiler() if job.profile else None
+    if profiler is not None:
+        profiler.merge(stats)
+    written, digest = write_page(job.source, job.dest, html, profiler, job.skip_unchanged, job.output_hash)
+    return None, written, digest, profiler.pages if profiler else None, document
+
+def run_page_jobs(jobs: list, workers: int = 1):
+    """
+    Build pages with reading, rendering and writing overlapped (see
+    run_pipeline), returning (error, bytes written, output hash, profiler
+    stats, search document) per job.
+    """
+    results = []
+    for error, result in run_pipeline(jobs, read_page_job, render_page_job, write_page_job, workers):
+        if error is not None:
+            results.append((f"{type(error).__name__}: {error}", 0, None, None, None))
+        else:
+            results.append(result)
+    return results
+
+def tracked_inputs(manifest: BuildManifest, source_path, template_path, basepath: str, values: dict = None,
+                   content_root=CONTENT_DIR, static_root=STATIC_DIR, options: RenderOptions = None):
+    """
+    The page's manifest inputs, including the template, images and pages it
+    depends on, and those shared values its template has a slot for. The
+    page's date counts too if the template shows it.
+    """
+    with open(source_path, "r") as source:
+        # block by block, so huge sources are never read whole
+        dependencies = page_dependencies(source_path, markdown_to_blocks(source), template_path,
+                                         content_root, static_root)
+        date = page_date(os.fstat(source.fileno()).st_mtime)
+    slots = load_template(template_path, basepath).slots
+    if values:
+        # a nav change must not rebuild pages whose template never shows the nav
+        values = {name: value for name, value in values.items() if name in slots}
+    assets = None
+    if options is not None and (options.fingerprints is not None or options.images is not None):
+        assets = asset_states(dependencies, template_path, basepath, static_root, options)
+    return manifest.page_inputs(source_path, template_path, basepath, values, dependencies,
+                                options.key if options is not None else None, assets,
+                                date if "Date" in slots else None)
+
+def asset_states(dependencies: dict, template_path, basepath: str, static_root, options: RenderOptions):
+    """
+    The fingerprinted names and image sizes a page's html holds, by
+    dependency path: those of the static files it embeds or links to, and
+    for its template, the names of the assets the template links to. A
+    changed asset then only rebuilds the pages that show it.
+    """
+    static_root = Path(static_root)
+    fingerprints, images = options.fingerprints, options.images
+    assets = {}
+    for path, kind in dependencies.items():
+        if kind in ("image", "file"):
+            relative = Path(path).relative_to(static_root).as_posix()
+            assets[path] = [fingerprints.get(relative) if fingerprints is not None else None,
+                            images.entries.get(relative) if images is not None else None]
+    if fingerprints is not None:
+        names = {}
+        for url in load_template(template_path, basepath).urls:
+            relative = url[1:].split("?", 1)[0].split("#", 1)[0]
+            names[relative] = fingerprints.get(relative)
+        assets[str(template_path)] = names
+    return assets
+
+def page_shard(source_path, content_root, count: int):
+    """
+    The shard (0 to count - 1) a page belongs to, from a hash of its path
+    inside content_root, so every machine agrees without coordinating.
+    """
+    relative = Path(source_path).relative_to(content_root).as_posix()
+    return int(hash_bytes(relative.encode())[:16], 16) % count
+
+def generate_page_recursive(dir_path_content, template_path, dest_dir_path, basepath: str,
+                            manifest: BuildManifest = None, workers: int = 1, cache: ASTCache = None,
+                            values: dict = None, profiler: BuildProfiler = None, skip_unchanged: bool = False,
+                            static_dir=STATIC_DIR, shard: tuple = None, options: RenderOptions = None):
+    """
+    Build every page under dir_path_content. With a manifest, pages whose
+    inputs are unchanged are skipped; with a manifest or skip_unchanged,
+    pages whose html comes out identical are not rewritten. shard is an
+    (index, count) pair, 1-based, to build only that slice of the pages.
+    With options.search_index the summary's documents hold every page's
+    search document by url, those of skipped pages from the manifest.
+    """
+    skip_unchanged = skip_unchanged or manifest is not None
+    page_jobs = collect_page_jobs(dir_path_content, dest_dir_path, exist_ok=skip_unchanged)
+    if shard is not None:
+        index, count = shard
+        page_jobs = [(path, dest) for path, dest in page_jobs
+                     if page_shard(path, dir_path_content, count) == index - 1]
+    summary = BuildSummary()
+    summary.outputs = [dest for _, dest in page_jobs]
+    searching = options is not None and options.search_index
+    resolve_url = UrlResolver(basepath)
+
+    pending = []
+    for path, dest_filepath in page_jobs:
+        temp_path = find_template(path, dir_path_content, template_path)
+        inputs = reason = None
+        if manifest is not None:
+            inputs = tracked_inputs(manifest, path, temp_path, basepath, values, dir_path_content, static_dir,
+                                    options)
+            reason = manifest.rebuild_reason(path, dest_filepath, inputs)
+            if reason is None and searching and manifest.search_document(path) is None:
+                reason = "not in the search index"
+            if reason is None:
+                logger.debug("Unchanged, skipping: %s", dest_filepath)
+                summary.pages_skipped += 1
+                if searching:
+                    summary.documents[resolve_url(page_url(path, dir_path_content))] = manifest.search_document(path)
+                continue
+            logger.debug("Rebuilding %s: %s", path, reason)
+        output_hash = manifest.output_hash(path, dest_filepath) if manifest is not None else None
+        job = PageJob(path, temp_path, dest_filepath, basepath, cache, values, profiler is not None,
+                      skip_unchanged, output_hash, options)
+        pending.append((job, inputs, reason))
+
+    results = run_page_jobs([job for job, _, _ in pending], workers)
+
+    failures = []
+    for (job, inputs, reason), (error, written, digest, stats, document) in zip(pending, results):
+        if stats is not None:
+            profiler.merge(stats)
+        if error is not None:
+            failures.append((job.source, error))
+            continue
+        summary.pages_built += 1
+        summary.bytes_written += written
+        if written == 0 and digest is not None:
+            logger.debug("Identical output, not rewritten: %s", job.dest)
+            summary.pages_unchanged += 1
+        if document is not None:
+            summary.documents[resolve_url(page_url(job.source, dir_path_content))] = document
+        if manifest is not None:
+            manifest.record(job.source, job.dest, inputs, digest, reason, document)
+    if failures:
+        raise PageBuildError(failures)
+    return summary
+
+def explain_rebuild(manifest: BuildManifest, page):
+    """
+    Describe why a page (given by its source or output path) was or wasn't
+    rebuilt by the last incremental build, and what it depends on.
+    """
+    key = manifest.find_page(page)
+    if key is None:
+        return f"{page} is not in {manifest.path}; run an --incremental build first"
+    entry = manifest.pages[key]
+    lines = [f"{key} -> {entry['dest']}"]
+    if entry.get("reason"):
+        lines.append(f"Rebuilt in the last build: {entry['reason']}")
+    else:
+        lines.append("Not rebuilt in the last build: no inputs changed")
+    lines.append("Depends on:")
+    for path, (kind, _) in sorted(entry["inputs"].get("deps", {}).items()):
+        lines.append(f"  {kind:<9} {path}")
+    dependents = manifest.dependents(key)
+    if dependents:
+        lines.append("Depended on by:")
+        lines.extend(f"  {source}" for source in dependents)
+    return "\n".join(lines)
+
+def build_site(basepath: str = "/", manifest: BuildManifest = None, workers: int = 1,
+               cache: ASTCache = None, output_dir: Path = OUTPUT_DIR, copy_mode: str = "copy",
+               profiler: BuildProfiler = None, skip_unchanged: bool = False, shard: tuple = None,
+               options: RenderOptions = None):
+    """
+    Build content/ and static/ into output_dir. Without a manifest the
+    output directory is wiped first; with one it is kept and only pages
+    whose inputs changed are regenerated. skip_unchanged keeps the
+    output directory too, rewriting only pages whose html differs and
+    pruning files the build no longer produces, so unchanged files keep
+    their mtimes for rsync and CDN uploads.
+
+    With shard, only that slice of the pages is built and static/ is left
+    for merge_shards.
+    """
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+    stages = profiler if profiler is not None else NullProfiler()
+    if manifest is not None:
+        manifest.start_build()
+        output_dir.mkdir(parents=True, exist_ok=True)
+    elif skip_unchanged:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        # make sure output directory exists
+        if output_dir.exists():
+            shutil.rmtree(output_dir)
+        output_dir.mkdir(parents=True)
+
+    # copy static files, skipping unchanged ones and dropping removed ones
+    if STATIC_DIR.exists() and shard is None:
+        previous = manifest.assets if manifest is not None else None
+        with stages.stage("static copy"):
+            assets, copied_bytes = sync_static(output_dir, copy_mode, previous, options, workers)
+        if manifest is not None:
+            manifest.assets = assets
+    else:
+        assets, copied_bytes = [], 0
+
+    try:
+        values = {"Nav": build_nav(CONTENT_DIR, UrlResolver(basepath))}
+        summary = generate_page_recursive(CONTENT_DIR, TEMPLATE_PATH, output_dir, basepath, manifest, workers,
+                                          cache, values, profiler, skip_unchanged, shard=shard,
+                                          options=options)
+        if options is not None and options.search_index:
+            with stages.stage("search index"):
+                if shard is None:
+                    written = write_search_index(summary.documents, output_dir, options.search_stem)
+                else:
+                    written = [write_search_documents(summary.documents, output_dir)]
+            summary.outputs.extend(output_dir / name for name in written)
+        if shard is not None or (skip_unchanged and manifest is None):
+            # what a wipe would have removed: anything this build didn't produce
+            # (for a shard, also the directories of other shards' pages)
+            keep = set(summary.outputs) | {output_dir / asset for asset in assets}
+            for path in prune_output(output_dir, keep):
+                logger.debug("Removed stale output: %s", path)
+        summary.assets = len(assets)
+        summary.asset_bytes = copied_bytes
+        summary.seconds = time.perf_counter() - start
+        return summary
+    finally:
+        if cache is not None:
+            cache.evict()
+        # pages that did build are still recorded when others fail
+        if manifest is not None:
+            for path in manifest.remove_stale(output_dir):
+                logger.debug("Removed stale page: %s", path)
+            manifest.save()
+
+def sync_static(output_dir: Path, copy_mode: str = "copy", previous: list = None,
+                options: RenderOptions = None, workers: int = 1):
+    """
+    sync_assets for static/, under fingerprinted names and with the asset
+    manifest if options has fingerprints, and with the resized copies of
+    images if it has responsive images. All of them count as assets.
+    """
+    fingerprints = options.fingerprints if options is not None else None
+    images = options.images if options is not None else None
+    names = fingerprints.names if fingerprints is not None else None
+    assets, copied_bytes = sync_assets(STATIC_DIR, output_dir, copy_mode, names=names)
+    if images is not None:
+        derivatives, derivative_bytes = write_derivatives(images, STATIC_DIR, output_dir, copy_mode, workers)
+        assets.extend(derivatives)
+        copied_bytes += derivative_bytes
+    if fingerprints is not None:
+        assets.append(fingerprints.write_manifest(output_dir))
+    remove_stale_assets(output_dir, previous, assets)
+    return assets, copied_bytes
+
+def merge_shards(shard_dirs: list, output_dir: Path = OUTPUT_DIR, copy_mode: str = "copy",
+                 options: RenderOptions = None, workers: int = 1):
+    """
+    Combine the output directories of a sharded build and the static
+    files (fingerprinted and resized as options say, like the shards'
+    pages were) into output_dir, and with options.search_index write the
+    search index of all the shards' pages. Files that are already up to date are left
+    alone and anything no longer produced is removed. Returns the number
+    of pages and assets merged.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    merged = {}
+    documents = {}
+    for shard_dir in map(Path, shard_dirs):
+        if not shard_dir.is_dir():
+            raise FileNotFoundError(f"shard output {shard_dir} does not exist")
+        for source_path in sorted(shard_dir.rglob("*")):
+            if source_path.is_dir():
+                continue
+            relative = source_path.relative_to(shard_dir)
+            if relative == Path(SEARCH_DOCUMENTS_NAME):
+                documents.update(load_search_documents(source_path))
+                continue
+            if relative in merged:
+                raise ValueError(f"{relative} is in both {merged[relative]} and {shard_dir}")
+            merged[relative] = shard_dir
+            dest_path = output_dir / relative
+            if asset_is_current(source_path, dest_path):
+                continue
+            dest_path.parent.mkdir(parents=True, exist_ok=True)
+            logger.debug("Merging page: %s -> %s", source_path, dest_path)
+            copy_file(source_path, dest_path, copy_mode)
+
+    assets = []
+    if STATIC_DIR.exists():
+        assets, _ = sync_static(output_dir, copy_mode, options=options, workers=workers)
+    keep = {output_dir / relative for relative in merged} | {output_dir / asset for asset in assets}
+    if options is not None and options.search_index:
+        keep.update(output_dir / name for name in write_search_index(documents, output_dir, options.search_stem))
+    for path in prune_output(output_dir, keep):
+        logger.debug("Removed stale output: %s", path)
+    return len(merged), len(assets)
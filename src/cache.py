@@ -0,0 +1,76 @@
+from blocks import *
+from manifest import hash_bytes
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+DEFAULT_CACHE_BYTES = 256 * 1024 * 1024
+
+class ASTCache:
+    """
+    On-disk cache of parsed pages, keyed by the markdown content, the
+    parser version and how the url resolver resolves the urls in that
+    markdown (see UrlResolver.cache_key). Entries are evicted least
+    recently used first once the directory grows past max_bytes.
+    """
+    def __init__(self, directory, max_bytes: int = DEFAULT_CACHE_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+
+    def key(self, markdown: str, resolve_url=None):
+        cache_key = getattr(resolve_url, "cache_key", None)
+        resolver_key = cache_key(markdown) if cache_key is not None else ""
+        return hash_bytes(f"{PARSER_VERSION}\0{resolver_key}\0{markdown}".encode())
+
+    def entry_path(self, key: str):
+        return self.directory / key[:2] / f"{key}.pickle"
+
+    def get(self, markdown: str, resolve_url=None):
+        path = self.entry_path(self.key(markdown, resolve_url))
+        try:
+            with open(path, "rb") as f:
+                node = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+            # a truncated or outdated entry is just a miss
+            path.unlink(missing_ok=True)
+            return None
+        # bump the mtime so eviction sees this entry as recently used
+        os.utime(path)
+        return node
+
+    def put(self, markdown: str, node, resolve_url=None):
+        path = self.entry_path(self.key(markdown, resolve_url))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file first so concurrent workers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(node, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def parse(self, markdown: str, resolve_url=None):
+        node = self.get(markdown, resolve_url)
+        if node is None:
+            node = markdown_to_html_node(markdown, resolve_url)
+            self.put(markdown, node, resolve_url)
+        return node
+
+    def evict(self):
+        if not self.directory.exists():
+            return []
+        entries = []
+        total = 0
+        for path in self.directory.glob("*/*.pickle"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        removed = []
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            path.unlink()
+            total -= size
+            removed.append(path)
+        return removed
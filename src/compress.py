@@ -0,0 +1,109 @@
+from assets import COMPRESSED_SUFFIXES
+from manifest import hash_bytes
+import gzip
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_SUFFIXES = (".html", ".css", ".js", ".svg", ".json", ".txt", ".xml")
+# below this the headers of a compressed response outweigh the savings
+MIN_COMPRESS_BYTES = 256
+COMPRESS_STATE_PATH = Path('.cache') / 'compress.json'
+
+def gzip_bytes(data: bytes):
+    # mtime=0 keeps the output identical between builds
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+def compressors():
+    """(suffix, function) for every format available here: gzip always, brotli if installed."""
+    formats = [(".gz", gzip_bytes)]
+    if brotli is not None:
+        formats.append((".br", brotli.compress))
+    return formats
+
+def is_compressible(path: Path):
+    return path.suffix in COMPRESSIBLE_SUFFIXES and path.stat().st_size >= MIN_COMPRESS_BYTES
+
+def compress_file(path: Path, previous: dict = None, formats: list = None):
+    """
+    Write the compressed siblings of path, unless its content hash matches
+    previous (the state recorded last time) and the siblings still exist.
+    Returns the new state and whether anything was written.
+    """
+    formats = formats or compressors()
+    stat = path.stat()
+    stamp = [stat.st_size, stat.st_mtime_ns]
+    siblings = [(path.with_name(path.name + suffix), compress) for suffix, compress in formats]
+    have_siblings = all(sibling.exists() for sibling, _ in siblings)
+    if previous and have_siblings and previous["stamp"] == stamp:
+        return previous, False
+    data = path.read_bytes()
+    digest = hash_bytes(data)
+    if previous and have_siblings and previous["hash"] == digest:
+        # touched but not changed
+        return {"stamp": stamp, "hash": digest}, False
+    for sibling, compress in siblings:
+        tmp_path = sibling.with_name(sibling.name + ".tmp")
+        tmp_path.write_bytes(compress(data))
+        os.replace(tmp_path, sibling)
+    return {"stamp": stamp, "hash": digest}, True
+
+def precompress(output_dir, state_path=COMPRESS_STATE_PATH, threads: int = None):
+    """
+    Give every compressible file under output_dir .gz (and .br) siblings in
+    a thread pool (zlib and brotli release the GIL), skipping files whose
+    content is unchanged since the siblings were written, and delete
+    siblings whose file is gone or no longer gets compressed (it shrank
+    below MIN_COMPRESS_BYTES). Returns (compressed, unchanged) counts.
+    """
+    output_dir = Path(output_dir)
+    state = load_state(state_path)
+    paths = [path for path in sorted(output_dir.rglob("*"))
+             if path.is_file() and path.suffix not in COMPRESSED_SUFFIXES and is_compressible(path)]
+
+    formats = compressors()
+    with ThreadPoolExecutor(threads or os.cpu_count()) as executor:
+        results = list(executor.map(lambda path: compress_file(path, state.get(str(path)), formats), paths))
+
+    compressed = 0
+    for path, (entry, written) in zip(paths, results):
+        state[str(path)] = entry
+        if written:
+            logger.debug("Compressed %s", path)
+            compressed += 1
+    # files of this output directory that are gone, or too small now, take
+    # their siblings along; left in place they would be served stale
+    current = {str(path) for path in paths}
+    for key in [key for key in state if Path(key).is_relative_to(output_dir) and key not in current]:
+        for suffix in COMPRESSED_SUFFIXES:
+            sibling = Path(key + suffix)
+            if sibling.exists():
+                logger.debug("Removing stale compressed file: %s", sibling)
+                sibling.unlink()
+        del state[key]
+    save_state(state_path, state)
+    return compressed, len(paths) - compressed
+
+def load_state(path):
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_state(path, state: dict):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
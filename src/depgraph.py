@@ -0,0 +1,60 @@
+from utils import extract_markdown_images, extract_markdown_links
+import posixpath
+from pathlib import Path
+from urllib.parse import urlparse
+
+def page_url(source_path, content_root):
+    """The url a page is served at: content/blog/index.md is /blog/, content/about.md is /about.html."""
+    relative = Path(source_path).relative_to(content_root).with_suffix("")
+    if relative.name == "index":
+        parent = relative.parent.as_posix()
+        return "/" if parent == "." else f"/{parent}/"
+    return f"/{relative.as_posix()}.html"
+
+def local_url_path(url: str, base_url: str):
+    """The site path a link points at, or None for external and anchor-only links."""
+    parsed = urlparse(url)
+    if parsed.scheme or parsed.netloc or not parsed.path:
+        return None
+    path = posixpath.normpath(posixpath.join(base_url, parsed.path))
+    return path.lstrip("/")
+
+def link_target(path: str, content_root: Path, static_root: Path):
+    """
+    The file a root-relative link resolves to, as (kind, path). Links to
+    pages resolve to their markdown source, anything else to static/. A
+    link to nothing resolves to the page it would most likely be.
+    """
+    stem = path[:-len(".html")] if path.endswith(".html") else path
+    candidates = [content_root / stem / "index.md"]
+    if stem:
+        candidates.append(content_root / f"{stem}.md")
+    for candidate in candidates:
+        if candidate.is_file():
+            return "page", candidate
+    if path and (static_root / path).is_file():
+        return "file", static_root / path
+    return "page", candidates[0]
+
+def page_dependencies(source_path, markdown, template_path, content_root, static_root):
+    """
+    Everything a page's output depends on besides its own markdown, as
+    {path: kind}: its template, the images it embeds and the pages and
+    files it links to. markdown is the page's text or an iterable of its
+    blocks.
+    """
+    content_root = Path(content_root)
+    static_root = Path(static_root)
+    base_url = page_url(source_path, content_root)
+    dependencies = {str(template_path): "template"}
+    for text in [markdown] if isinstance(markdown, str) else markdown:
+        for _, url in extract_markdown_images(text):
+            path = local_url_path(url, base_url)
+            if path:
+                dependencies[str(static_root / path)] = "image"
+        for _, url in extract_markdown_links(text):
+            path = local_url_path(url, base_url)
+            if path is not None:
+                kind, target = link_target(path, content_root, static_root)
+                dependencies.setdefault(str(target), kind)
+    return dependencies
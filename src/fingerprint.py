@@ -0,0 +1,70 @@
+from assets import write_if_changed
+from compress import load_state, save_state
+from manifest import hash_bytes, hash_file
+import json
+from pathlib import Path, PurePosixPath
+
+FINGERPRINT_STATE_PATH = Path('.cache') / 'fingerprints.json'
+# written to the output root: {"index.css": "index.0123456789ab.css", ...}
+ASSET_MANIFEST_NAME = "asset-manifest.json"
+FINGERPRINT_LENGTH = 12
+# files referenced from pages and templates; anything else (robots.txt,
+# favicon.ico, CNAME) is fetched by its well-known name and keeps it
+FINGERPRINT_SUFFIXES = (".css", ".js", ".png", ".jpg", ".jpeg", ".gif", ".webp", ".avif", ".svg",
+                        ".woff", ".woff2")
+
+def fingerprinted_name(relative: str, digest: str):
+    """images/tom.png with content hash 0123456789ab... becomes images/tom.0123456789ab.png."""
+    path = PurePosixPath(relative)
+    return str(path.with_name(f"{path.stem}.{digest[:FINGERPRINT_LENGTH]}{path.suffix}"))
+
+class AssetFingerprints:
+    """
+    The fingerprinted name of every static asset that gets one, by its
+    path relative to static/. key identifies the whole mapping, for the
+    compiled templates kept in memory.
+    """
+    __slots__ = ("names", "key")
+
+    def __init__(self, names: dict):
+        self.names = names
+        self.key = hash_bytes(json.dumps(names, sort_keys=True).encode())[:16]
+
+    def get(self, relative: str, default: str = None):
+        return self.names.get(relative, default)
+
+    def write_manifest(self, output_dir):
+        """Write the asset manifest unless it is already current. Returns its name."""
+        data = json.dumps(self.names, indent=1, sort_keys=True) + "\n"
+        write_if_changed(Path(output_dir) / ASSET_MANIFEST_NAME, data)
+        return ASSET_MANIFEST_NAME
+
+def asset_hashes(static_dir, suffixes: tuple, state_path=None):
+    """
+    The content hash of every file under static_dir with one of suffixes,
+    by relative path. Hashes are kept in state_path and reused while a
+    file's size and mtime are unchanged; without a state_path every file
+    is hashed.
+    """
+    static_dir = Path(static_dir)
+    state = load_state(state_path) if state_path is not None else {}
+    entries = {}
+    hashes = {}
+    for source_path in sorted(static_dir.rglob("*")):
+        if source_path.suffix.lower() not in suffixes or not source_path.is_file():
+            continue
+        stat = source_path.stat()
+        stamp = [stat.st_size, stat.st_mtime_ns]
+        entry = state.get(str(source_path))
+        if entry is None or entry["stamp"] != stamp:
+            entry = {"stamp": stamp, "hash": hash_file(source_path)}
+        entries[str(source_path)] = entry
+        hashes[source_path.relative_to(static_dir).as_posix()] = entry["hash"]
+    if state_path is not None and entries != state:
+        save_state(state_path, entries)
+    return hashes
+
+def fingerprint_assets(static_dir, state_path=FINGERPRINT_STATE_PATH):
+    """Fingerprint the assets under static_dir, hashing them as asset_hashes does."""
+    hashes = asset_hashes(static_dir, FINGERPRINT_SUFFIXES, state_path)
+    return AssetFingerprints({relative: fingerprinted_name(relative, digest) for relative, digest in hashes.items()})
@@ -1,5 +1,14 @@
+import re
+
+WHITESPACE_RE = re.compile(r"\s+")
+# whitespace inside these elements is part of the content
+PRESERVE_WHITESPACE_TAGS = ("pre", "code", "textarea")
+
 
 class HTMLNode:
+    # pages are made of many thousands of small nodes, so skip the per-instance __dict__
+    __slots__ = ("tag", "value", "children", "props")
+
     def __init__(self, tag: str = None, value: str = None, children: list = None, props: dict = None):
         self.tag = tag
         self.value = value
@@ -8,14 +17,19 @@ class HTMLNode:
 
     def to_html(self):
         raise NotImplementedError
+
+    def iter_html(self):
+        # subclasses yield their markup in chunks; fall back to to_html
+        yield self.to_html()
+
+    def write_html(self, fp):
+        """Stream the rendered markup into anything with a write() method."""
+        fp.writelines(self.iter_html())
     
     def props_to_html(self):
-        result = ""
         if self.props is None:
-            return result
-        for key, value in self.props.items():
-            result += f' {key}="{value}"'
-        return result
+            return ""
+        return "".join(f' {key}="{value}"' for key, value in self.props.items())
     
     def __repr__(self):
         return f"HTMLNode({self.tag}, {self.value}, {self.children}, {self.props})"
@@ -27,6 +41,8 @@ class HTMLNode:
             return False
         
 class LeafNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag: str, value: str, props: dict = None):
         super().__init__(tag=tag, value=value, props=props)
 
@@ -39,16 +55,43 @@ class LeafNode(HTMLNode):
             return f"<{self.tag}{self.props_to_html()}>{self.value}</{self.tag}>"
         
 class ParentNode(HTMLNode):
+    __slots__ = ()
+
     def __init__(self, tag: str, children: list, props: dict = None):
         super().__init__(tag=tag, children=children, props=props)
 
     def to_html(self):
+        return "".join(self.iter_html())
+
+    def iter_html(self):
         if self.tag is None:
             raise ValueError("tag is required for parent node")
         if self.children is None:
             raise ValueError("no children provided for parent node")
-        final_html = f"<{self.tag}>"
+        yield f"<{self.tag}>"
         for child in self.children:
-            final_html += child.to_html()
-        final_html += f"</{self.tag}>"
-        return final_html
\ No newline at end of file
+            yield from child.iter_html()
+        yield f"</{self.tag}>"
+
+def leaf_text(node: HTMLNode):
+    if node.children is None:
+        if node.tag != "img":
+            yield node.value
+        return
+    for child in node.children:
+        yield from leaf_text(child)
+
+def minify_node(node: HTMLNode):
+    """
+    Collapse every run of whitespace in the tree's text into one space, in
+    place, leaving pre and code elements alone. Returns the node.
+    """
+    if node.tag in PRESERVE_WHITESPACE_TAGS:
+        return node
+    if node.children is None:
+        if node.value:
+            node.value = WHITESPACE_RE.sub(" ", node.value)
+    else:
+        for child in node.children:
+            minify_node(child)
+    return node
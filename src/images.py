@@ -0,0 +1,155 @@
+from assets import asset_is_current, copy_file
+from fingerprint import asset_hashes
+import logging
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path, PurePosixPath
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = (".png", ".jpg", ".jpeg", ".gif", ".webp")
+IMAGE_CACHE_DIR = Path('.cache') / 'images'
+IMAGE_STATE_PATH = Path('.cache') / 'images.json'
+# index.css caps the page at 800px
+DEFAULT_IMAGE_SIZES = "(max-width: 800px) 100vw, 800px"
+# start-of-frame markers, the ones that carry a jpeg's dimensions
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def image_size(path):
+    """(width, height) of an image, from its header, or None if it can't be read."""
+    if Image is not None:
+        try:
+            with Image.open(path) as image:
+                return image.size
+        except OSError:
+            return None
+    with open(path, "rb") as f:
+        header = f.read(26)
+        if header.startswith(b"\x89PNG\r\n\x1a\n") and header[12:16] == b"IHDR":
+            return struct.unpack(">II", header[16:24])
+        if header[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", header[6:10])
+        if header.startswith(b"\xff\xd8"):
+            f.seek(2)
+            while (marker := f.read(4)) and len(marker) == 4 and marker[0] == 0xFF:
+                length = struct.unpack(">H", marker[2:])[0]
+                if marker[1] in JPEG_SOF_MARKERS:
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    return None
+
+def derivative_name(name: str, width: int):
+    """images/tom.png at 480 pixels wide is images/tom.480w.png."""
+    path = PurePosixPath(name)
+    return str(path.with_name(f"{path.stem}.{width}w{path.suffix}"))
+
+class ResponsiveImages:
+    """
+    The size of every static image and the narrower copies made of it, by
+    its path relative to static/. An entry is [width, height, name,
+    [[derivative name, width], ...]], names being paths in the output.
+    """
+    __slots__ = ("entries", "sizes")
+
+    def __init__(self, entries: dict, sizes: str = DEFAULT_IMAGE_SIZES):
+        self.entries = entries
+        self.sizes = sizes
+
+    def attributes(self, relative: str, url_for):
+        """The width, height, srcset and sizes of an img, with url_for turning output names into urls."""
+        entry = self.entries.get(relative)
+        if entry is None:
+            return {}
+        width, height, name, derivatives = entry
+        attributes = {"width": str(width), "height": str(height)}
+        if derivatives:
+            candidates = [f"{url_for(derived)} {derived_width}w" for derived, derived_width in derivatives]
+            candidates.append(f"{url_for(name)} {width}w")
+            attributes["srcset"] = ", ".join(candidates)
+            attributes["sizes"] = self.sizes
+        return attributes
+
+def plan_images(static_dir, widths: list, fingerprints=None, sizes: str = DEFAULT_IMAGE_SIZES):
+    """
+    Read the size of every image under static_dir and name a copy for
+    each of widths narrower than the image. Only headers are read, so
+    this is cheap enough for every shard to do. Without Pillow images
+    get no copies, only their width and height.
+    """
+    static_dir = Path(static_dir)
+    if Image is None and widths:
+        logger.warning("Pillow is not installed; images get width and height but no resized copies")
+        widths = []
+    entries = {}
+    for source_path in sorted(static_dir.rglob("*")):
+        if source_path.suffix.lower() not in IMAGE_SUFFIXES or not source_path.is_file():
+            continue
+        size = image_size(source_path)
+        if size is None:
+            logger.warning("Cannot read the size of %s", source_path)
+            continue
+        relative = source_path.relative_to(static_dir).as_posix()
+        name = fingerprints.get(relative, relative) if fingerprints is not None else relative
+        derivatives = [[derivative_name(name, width), width] for width in sorted(set(widths)) if width < size[0]]
+        entries[relative] = [size[0], size[1], name, derivatives]
+    return ResponsiveImages(entries, sizes)
+
+def resize_image(source_path: Path, dest_path: Path, width: int):
+    """Write source_path scaled down to width (keeping its aspect ratio and format) to dest_path."""
+    with Image.open(source_path) as image:
+        height = max(1, round(image.height * width / image.width))
+        resized = image.resize((width, height), Image.LANCZOS)
+        tmp_path = dest_path.with_name(dest_path.name + ".tmp")
+        resized.save(tmp_path, format=image.format, optimize=True)
+    os.replace(tmp_path, dest_path)
+    return dest_path
+
+def write_derivatives(images: ResponsiveImages, static_dir, output_dir, copy_mode: str = "copy",
+                      workers: int = 1, cache_dir=IMAGE_CACHE_DIR, state_path=IMAGE_STATE_PATH):
+    """
+    Make the resized copies planned in images and copy them into
+    output_dir. Copies are cached in cache_dir by the source's content
+    hash and width, so an image is only resized again when it changes;
+    the rest are resized in a pool of worker processes. Returns the
+    output names and the number of bytes copied.
+    """
+    static_dir, output_dir, cache_dir = Path(static_dir), Path(output_dir), Path(cache_dir)
+    planned = {relative: entry for relative, entry in images.entries.items() if entry[3]}
+    hashes = asset_hashes(static_dir, IMAGE_SUFFIXES, state_path) if planned else {}
+
+    copies = []
+    missing = []
+    for relative, (_, _, _, derivatives) in planned.items():
+        for name, width in derivatives:
+            cached = cache_dir / f"{hashes[relative]}-{width}{PurePosixPath(relative).suffix}"
+            copies.append((cached, output_dir / name))
+            if not cached.exists():
+                missing.append((static_dir / relative, cached, width))
+    if missing:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        logger.debug("Resizing %d image(s)", len(missing))
+        if workers > 1 and len(missing) > 1:
+            with ProcessPoolExecutor(workers) as executor:
+                list(executor.map(resize_image, *zip(*missing)))
+        else:
+            for source_path, cached, width in missing:
+                resize_image(source_path, cached, width)
+
+    names = []
+    copied_bytes = 0
+    for cached, dest_path in copies:
+        names.append(dest_path.relative_to(output_dir).as_posix())
+        if asset_is_current(cached, dest_path):
+            continue
+        dest_path.parent.mkdir(parents=True, exist_ok=True)
+        logger.debug("Copying image: %s -> %s", cached, dest_path)
+        copy_file(cached, dest_path, copy_mode)
+        copied_bytes += cached.stat().st_size
+    return names, copied_bytes
@@ -1,103 +1,236 @@
-from textnode import *
-from htmlnode import *
-from utils import *
-from blocks import *
-import os
-import shutil
-from pathlib import Path
+from build import *
+from watch import watch_site
+from compress import precompress
+import argparse
+import logging
+import logging.handlers
 import sys
 
-def clean_and_copy(sourcepath: Path, destpath: Path):
-    assert sourcepath.exists(), f"Source path {sourcepath} does not exist"
+logger = logging.getLogger(__name__)
 
-    # see if the destination path exists, if not, make it along with parent dirs
-    if not destpath.exists():
-        destpath.mkdir(parents=True)
-        
-    if sourcepath.is_file():
-        print(f"Copying file: {sourcepath} -> {destpath}")
-        shutil.copy(sourcepath, destpath)
-    else:
-        print(f"Copying directory contents: {sourcepath} -> {destpath}")
-        child_paths = sourcepath.iterdir()
-        for path in child_paths:
-            new_source_path = sourcepath / path.name
-            new_dest_path = destpath / path.name
-            if new_source_path.is_dir():
-                # for directories, ensure directory exists
-                if not new_dest_path.exists():
-                    new_dest_path.mkdir()
-                clean_and_copy(new_source_path, new_dest_path)
-            else:
-                # for files, copy them directly
-                shutil.copy(new_source_path, new_dest_path)
-
-def extract_title(markdown: str):
-    assert get_heading_block_tag(markdown) == "h1", "title must be of type <h1>"
-    return extract_heading_content(markdown)
-
-def generate_page(from_path: str, template_path: str, dest_path: str, basepath: str):
-    print(f"Generating page {from_path} -> {dest_path} using {template_path}")
-    with open(from_path,"r") as source:
-        source_text = source.read()
-    with open(template_path,"r") as template:
-        template_text = template.read()
-    source_html = markdown_to_html_node(source_text).to_html()
-    page_title = extract_title(source_text)
-    
-    page_html = template_text.replace('{{ Title }}', page_title).replace('{{ Content }}',source_html)
-
-    final_html = page_html.replace('href="/',f'href="{basepath}').replace('src="/',f'src="{basepath}')
-
-    if os.path.isfile(dest_path):
-        print(f"{dest_path} file already exists.")
-    else:
-        print(f"{dest_path} isn't a file. Creating it now...")
-
-    with open(dest_path, "w") as file:
-        file.write(final_html)
-
-def generate_page_recursive(dir_path_content, template_path, dest_dir_path, basepath: str):
-    content_path = Path(dir_path_content)
-    temp_path = Path(template_path)
-    dest_path = Path(dest_dir_path)
-
-    for path in content_path.iterdir():
-        new_dest_path = dest_path / path.name
-        if path.is_dir():
-            print(f"Path: {path}")
-            print(f"Parent Path: {path.parent}")
-            print(f"Making Dest Path: {new_dest_path}")
-            new_dest_path.mkdir()
-            print(new_dest_path.exists())
-            generate_page_recursive(path, template_path, new_dest_path, basepath)
-        elif path.is_file() and str(path).endswith('.md'):
-            print(f"Found markdown file: {path}")
-            dest_filepath = new_dest_path.parent / (new_dest_path.stem + '.html')
-            print(f"Generating new file: {dest_filepath}")
-            generate_page(path, temp_path, dest_filepath, basepath)
-
-def get_sys_args(default='/'):
-    if len(sys.argv) > 1:
-        return sys.argv[1]
+COMMANDS = ("build", "watch", "why-rebuilt", "merge")
+SHARDS_DIR = Path('.cache') / 'shards'
+PROFILE_PATH = Path('.cache') / 'profile.json'
+# verbose output is buffered and written in batches instead of one write per line
+LOG_BUFFER_RECORDS = 1000
+
+def parse_shard(value: str):
+    index, _, count = value.partition("/")
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/N, e.g. 1/4, not {value!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index} is not between 1 and {count}")
+    return index, count
+
+def add_precompress(parser: argparse.ArgumentParser):
+    parser.add_argument("--precompress", action="store_true",
+                        help="write .gz (and .br, with the brotli module) next to every html, css, js "
+                             "and other text file of the output")
+
+def add_fingerprint(parser: argparse.ArgumentParser):
+    parser.add_argument("--fingerprint", action="store_true",
+                        help=f"name static assets after their content (index.<hash>.css), point links at "
+                             f"those names and list them in {ASSET_MANIFEST_NAME}")
+
+def parse_widths(value: str):
+    try:
+        widths = [int(width) for width in value.split(",") if width.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected pixel widths such as 480,960, not {value!r}")
+    if any(width <= 0 for width in widths):
+        raise argparse.ArgumentTypeError(f"widths must be positive, not {value!r}")
+    return widths
+
+def add_image_widths(parser: argparse.ArgumentParser):
+    parser.add_argument("--image-widths", type=parse_widths, metavar="W,W,...",
+                        help="resize static images to these widths (e.g. 480,960) and list the copies in "
+                             "srcset; images also get width and height attributes")
+
+def add_search_index(parser: argparse.ArgumentParser):
+    parser.add_argument("--search-index", action="store_true",
+                        help=f"write a search index of every page's text to {SEARCH_DIR}/, in shards "
+                             "by first letter")
+    parser.add_argument("--search-stem", action="store_true",
+                        help="index words by their stem (searching -> search)")
+
+def add_verbosity(parser: argparse.ArgumentParser):
+    verbosity = parser.add_mutually_exclusive_group()
+    verbosity.add_argument("-v", "--verbose", action="store_true",
+                           help="log every generated page and copied file")
+    verbosity.add_argument("-q", "--quiet", action="store_true",
+                           help="only log warnings and errors")
+
+def parse_args(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    command = argv.pop(0) if argv and argv[0] in COMMANDS else "build"
+    if command == "why-rebuilt":
+        parser = argparse.ArgumentParser(prog="main.py why-rebuilt",
+                                         description="Explain why the last incremental build rebuilt a page")
+        parser.add_argument("page", help="markdown source or html output of the page, e.g. content/index.md")
+        parser.add_argument("--manifest", type=Path, default=MANIFEST_PATH, help="manifest of the last build")
+        args = parser.parse_args(argv)
+        args.command = command
+        return args
+    if command == "merge":
+        parser = argparse.ArgumentParser(prog="main.py merge",
+                                         description="Combine the output of sharded builds and static/")
+        parser.add_argument("shards", nargs="+", type=Path, help="output directories of the shards")
+        parser.add_argument("--output", type=Path, default=OUTPUT_DIR, help="directory to merge into")
+        parser.add_argument("--copy-mode", choices=COPY_MODES, default="copy",
+                            help="how files reach the output: copy (copy_file_range), hardlink or reflink")
+        add_precompress(parser)
+        add_fingerprint(parser)
+        add_image_widths(parser)
+        add_search_index(parser)
+        add_verbosity(parser)
+        args = parser.parse_args(argv)
+        args.command = command
+        return args
+    parser = argparse.ArgumentParser(prog=f"main.py {command}",
+                                     description="Build the site from content/ and static/ into docs/")
+    parser.add_argument("basepath", nargs="?", default="/",
+                        help="prefix for root-relative links, e.g. /static-site/")
+    parser.add_argument("--incremental", action="store_true",
+                        help="keep docs/ and only rebuild pages whose inputs changed")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="keep docs/ and leave pages whose html is unchanged untouched "
+                             "(always on with --incremental)")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of worker processes for page generation (0 = one per CPU)")
+    parser.add_argument("--cache", action="store_true",
+                        help=f"reuse parsed pages from {AST_CACHE_DIR} when their markdown is unchanged")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+                        help="size limit of the parse cache in MB")
+    parser.add_argument("--copy-mode", choices=COPY_MODES, default="copy",
+                        help="how static files reach docs/: copy (copy_file_range), hardlink or reflink")
+    parser.add_argument("--minify", action="store_true",
+                        help="collapse insignificant whitespace in the html (pre and code are kept as is)")
+    parser.add_argument("--profile", action="store_true",
+                        help="record time and allocations per build stage and page")
+    parser.add_argument("--profile-output", type=Path, default=PROFILE_PATH,
+                        help="where --profile writes its JSON report")
+    parser.add_argument("--profile-top", type=int, default=10,
+                        help="number of slowest pages listed by --profile")
+    add_verbosity(parser)
+    if command == "build":
+        parser.add_argument("--shard", type=parse_shard,
+                            help=f"build only slice i of N (e.g. 2/4) into {SHARDS_DIR}/i-of-N; "
+                                 "combine the slices with the merge command")
+        parser.add_argument("--output", type=Path,
+                            help="output directory (default: docs/, or the shard's directory)")
+        add_precompress(parser)
+        add_fingerprint(parser)
+        add_image_widths(parser)
+        add_search_index(parser)
+    if command == "watch":
+        parser.add_argument("--port", type=int, default=8888,
+                            help="port for the live-reloading dev server")
+    args = parser.parse_args(argv)
+    args.command = command
+    return args
+
+def configure_logging(verbose: bool = False, quiet: bool = False, stream=None, buffered: bool = True):
+    """
+    By default only the end-of-build summary is logged. Verbose output goes
+    through a MemoryHandler so per-file lines are flushed in batches (and
+    straight away on warnings and errors), unless buffered is off, as it is
+    for long-running commands whose lines must show up as they happen.
+    """
+    stream_handler = logging.StreamHandler(stream or sys.stdout)
+    if verbose:
+        stream_handler.setFormatter(logging.Formatter("[%(levelname)s] %(name)s: %(message)s"))
+        handler = stream_handler
+        if buffered:
+            handler = logging.handlers.MemoryHandler(LOG_BUFFER_RECORDS, logging.WARNING, stream_handler)
+        level = logging.DEBUG
     else:
-        return default
+        stream_handler.setFormatter(logging.Formatter("%(message)s"))
+        handler = stream_handler
+        level = logging.WARNING if quiet else logging.INFO
+    root = logging.getLogger()
+    for old in root.handlers[:]:
+        root.removeHandler(old)
+        old.close()
+    root.addHandler(handler)
+    root.setLevel(level)
+    return handler
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command == "why-rebuilt":
+        print(explain_rebuild(BuildManifest.load(args.manifest), args.page))
+        return
+    # watch runs until interrupted, so a buffer would hold its lines back for good
+    handler = configure_logging(args.verbose, args.quiet, buffered=args.command != "watch")
+    try:
+        run(args)
+    finally:
+        handler.flush()
+
+def run_precompress(output_dir: Path):
+    start = time.perf_counter()
+    compressed, unchanged = precompress(output_dir)
+    logger.info("Precompressed %d files (%d unchanged) in %.2fs", compressed, unchanged,
+                time.perf_counter() - start)
+
+def static_options(args, options: RenderOptions):
+    """
+    Add the fingerprints, image sizes and search index asked for by
+    --fingerprint, --image-widths and --search-index to options.
+    """
+    if args.fingerprint:
+        # shards run side by side, so they don't share the hash state file
+        state_path = FINGERPRINT_STATE_PATH if getattr(args, "shard", None) is None else None
+        options.fingerprints = fingerprint_assets(STATIC_DIR, state_path)
+    if args.image_widths is not None:
+        options.images = plan_images(STATIC_DIR, args.image_widths, options.fingerprints)
+    options.search_index = args.search_index
+    options.search_stem = args.search_stem
+    return options
+
+def run(args):
+    if args.command == "merge":
+        start = time.perf_counter()
+        options = static_options(args, RenderOptions())
+        pages, assets = merge_shards(args.shards, args.output, args.copy_mode, options, os.cpu_count())
+        logger.info("Merged %d files from %d shards and %d assets into %s in %.2fs",
+                    pages, len(args.shards), assets, args.output, time.perf_counter() - start)
+        if args.precompress:
+            run_precompress(args.output)
+        return
 
-def main():
-    base_path = get_sys_args()
-    print(f"Base Path: {base_path}")
-    output_dir = Path('docs')
+    base_path = args.basepath
+    logger.debug("Base Path: %s", base_path)
 
-    # make sure output directory exists
-    if output_dir.exists():
-        shutil.rmtree(output_dir)
-    output_dir.mkdir()
+    cache = None
+    if args.cache:
+        cache = ASTCache(AST_CACHE_DIR, args.cache_size * 1024 * 1024)
+    workers = args.jobs if args.jobs > 0 else os.cpu_count()
+    options = RenderOptions(minify=args.minify)
 
-    # copy static files
-    static_dir = Path('static')
-    if static_dir.exists():
-        clean_and_copy(static_dir, output_dir)
+    if args.command == "watch":
+        watch_site(base_path, args.port, workers, cache, args.copy_mode, options)
+        return
 
-    generate_page_recursive('content', 'template.html', output_dir, base_path)
+    options = static_options(args, options)
+    output_dir, manifest_path = args.output or OUTPUT_DIR, MANIFEST_PATH
+    if args.shard is not None:
+        name = "{}-of-{}".format(*args.shard)
+        output_dir = args.output or SHARDS_DIR / name
+        manifest_path = MANIFEST_PATH.with_suffix(f".{name}.json")
+    manifest = BuildManifest.load(manifest_path) if args.incremental else None
+    profiler = BuildProfiler() if args.profile else None
+    summary = build_site(base_path, manifest, workers, cache, output_dir, args.copy_mode, profiler,
+                         args.skip_unchanged, args.shard, options)
+    logger.info("%s", summary)
+    if args.precompress:
+        run_precompress(output_dir)
+    if profiler is not None:
+        profiler.write_report(args.profile_output)
+        logger.info("%s", profiler.summary(args.profile_top))
+        logger.info("Profile written to %s", args.profile_output)
 
-main()
\ No newline at end of file
+if __name__ == "__main__":
+    main()
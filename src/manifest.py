@@ -0,0 +1,198 @@
+from assets import remove_output
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_VERSION = 3
+
+def hash_bytes(data: bytes):
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(path, chunk_size: int = 1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class BuildManifest:
+    """
+    Records the inputs each generated page was built from so that a later
+    build can skip pages whose markdown, template and basepath are unchanged.
+    The inputs include the page's dependencies (template, images, linked
+    pages), which makes the manifest a dependency graph between builds.
+    """
+    def __init__(self, path: Path, pages: dict = None, assets: list = None):
+        self.path = Path(path)
+        self.pages = pages if pages is not None else {}
+        self.assets = assets if assets is not None else []
+        self.seen = set()
+        self._file_hashes = {}
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        try:
+            with open(path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(path)
+        if data.get("version") != MANIFEST_VERSION:
+            return cls(path)
+        return cls(path, data.get("pages", {}), data.get("assets", []))
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"version": MANIFEST_VERSION, "pages": self.pages, "assets": self.assets}
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def start_build(self):
+        # a long-lived manifest (watch mode) must not reuse hashes between builds
+        self.seen = set()
+        self._file_hashes = {}
+
+    def file_hash(self, path):
+        # templates are shared by every page, so only hash them once per build
+        key = str(path)
+        if key not in self._file_hashes:
+            self._file_hashes[key] = hash_file(path)
+        return self._file_hashes[key]
+
+    def dependency_state(self, path, kind: str):
+        # the template is rendered into the page, so it counts by content;
+        # pages, images and files are only linked to, and their content never
+        # reaches the html, so it is enough that they exist (page_inputs adds
+        # their fingerprinted names and image sizes)
+        if kind != "template":
+            return Path(path).is_file()
+        try:
+            return self.file_hash(path)
+        except FileNotFoundError:
+            return None
+
+    def page_inputs(self, source_path, template_path, basepath: str, values: dict = None,
+                    dependencies: dict = None, options: dict = None, assets: dict = None, date: str = None):
+        """
+        Everything the page's output is built from. assets holds, by
+        dependency path, what the render options make of a dependency
+        (such as an image's fingerprinted name and size); it is recorded
+        with the state of dependencies that exist. date is the page's date,
+        given when its template shows it.
+        """
+        if dependencies is None:
+            dependencies = {str(template_path): "template"}
+        deps = {}
+        for path, kind in dependencies.items():
+            state = self.dependency_state(path, kind)
+            if state and assets and path in assets:
+                state = [state, assets[path]]
+            deps[path] = [kind, state]
+        inputs = {
+            "source": self.file_hash(source_path),
+            "basepath": basepath,
+            "deps": deps,
+        }
+        if values:
+            # shared placeholder values such as the site nav
+            inputs["values"] = hash_bytes(json.dumps(values, sort_keys=True).encode())
+        if date is not None:
+            # taken from the source's mtime, so a touch changes it
+            inputs["date"] = date
+        if options and any(options.values()):
+            # render options such as --minify; left out when all are off
+            inputs["options"] = options
+        return inputs
+
+    def rebuild_reason(self, source_path, dest_path, inputs: dict):
+        """
+        Why the page has to be rebuilt, or None if its output is current.
+        Either way the page counts as seen in this build.
+        """
+        key = str(source_path)
+        self.seen.add(key)
+        entry = self.pages.get(key)
+        if entry is None:
+            return "new page"
+        if entry.get("dest") != str(dest_path) or not Path(dest_path).exists():
+            return "output is missing"
+        previous = entry["inputs"]
+        if previous.get("source") != inputs["source"]:
+            return "markdown changed"
+        if previous.get("basepath") != inputs["basepath"]:
+            return f"basepath changed to {inputs['basepath']}"
+        if previous.get("date") != inputs.get("date"):
+            return f"date changed to {inputs.get('date')}"
+        if previous.get("values") != inputs.get("values"):
+            return "shared values (nav) changed"
+        if previous.get("options") != inputs.get("options"):
+            return "render options changed"
+        old_deps, new_deps = previous.get("deps", {}), inputs["deps"]
+        for path in sorted(old_deps.keys() | new_deps.keys()):
+            if path not in old_deps:
+                return f"now depends on {new_deps[path][0]} {path}"
+            if path not in new_deps:
+                return f"no longer depends on {old_deps[path][0]} {path}"
+            (kind, old), (_, new) = old_deps[path], new_deps[path]
+            if old != new:
+                if not new:
+                    return f"{kind} {path} was removed"
+                return f"{kind} {path} was added" if not old else f"{kind} {path} changed"
+        entry["reason"] = None
+        return None
+
+    def record(self, source_path, dest_path, inputs: dict, output: str = None, reason: str = None,
+               search: dict = None):
+        key = str(source_path)
+        self.seen.add(key)
+        self.pages[key] = {"dest": str(dest_path), "inputs": inputs, "reason": reason}
+        if output is not None:
+            self.pages[key]["output"] = output
+        if search is not None:
+            # kept so skipped pages can still go into the search index
+            self.pages[key]["search"] = search
+
+    def search_document(self, source_path):
+        """The search document recorded with the page, if any."""
+        entry = self.pages.get(str(source_path))
+        return entry.get("search") if entry is not None else None
+
+    def dependents(self, path):
+        """Sources of every page that depends on path."""
+        path = str(path)
+        return sorted(key for key, entry in self.pages.items() if path in entry["inputs"].get("deps", {}))
+
+    def find_page(self, page):
+        """The manifest key for a page given by its source or output path."""
+        page = str(page)
+        if page in self.pages:
+            return page
+        for key, entry in self.pages.items():
+            if entry["dest"] == page:
+                return key
+        return None
+
+    def output_hash(self, source_path, dest_path):
+        """Hash of the html last written for this page, if it is known."""
+        entry = self.pages.get(str(source_path))
+        if entry is None or entry.get("dest") != str(dest_path):
+            return None
+        return entry.get("output")
+
+    def remove_stale(self, output_root):
+        """
+        Delete outputs whose markdown sources were not seen in this build,
+        along with any directories left empty underneath output_root.
+        """
+        removed = []
+        for key in sorted(set(self.pages) - self.seen):
+            dest = Path(self.pages.pop(key)["dest"])
+            if dest.exists():
+                removed.append(dest)
+            remove_output(output_root, dest)
+        return removed
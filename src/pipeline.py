@@ -0,0 +1,94 @@
+import contextlib
+import queue
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+IO_THREADS = 8
+PIPELINE_DEPTH = 32
+
+_DONE = object()
+
+def run_now(fn, *args):
+    """Call fn right away and wrap the outcome in a finished Future."""
+    future = Future()
+    try:
+        future.set_result(fn(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+def run_pipeline(items, read, render, write, workers: int = 1, io_threads: int = IO_THREADS,
+                 depth: int = PIPELINE_DEPTH):
+    """
+    Run read(item) -> render(item, data) -> write(item, output) over items
+    as three overlapping stages. Reads and writes run on a thread pool so
+    their waits overlap with each other and with rendering, which happens
+    in this thread, or in a process pool when workers > 1 (render must be
+    picklable then).
+
+    At most depth items wait between two stages, so a slow stage holds back
+    the ones before it instead of letting read files pile up in memory.
+
+    Returns (error, result) for each item in order, where error is the
+    exception raised by whichever stage failed, or None.
+    """
+    items = list(items)
+    results = [None] * len(items)
+    read_queue = queue.Queue(depth)
+    write_queue = queue.Queue(depth)
+    write_slots = threading.BoundedSemaphore(depth)
+
+    def finish(index, future):
+        write_slots.release()
+        error = future.exception()
+        results[index] = (error, None if error is not None else future.result())
+
+    with contextlib.ExitStack() as stack:
+        io = stack.enter_context(ThreadPoolExecutor(io_threads))
+        cpu = None
+        if workers > 1 and len(items) > 1:
+            cpu = stack.enter_context(ProcessPoolExecutor(workers))
+            # start the worker processes now, before the reader and writer
+            # threads exist, so none of them is forked while a thread holds a lock
+            cpu.submit(int).result()
+
+        def reader():
+            try:
+                for index, item in enumerate(items):
+                    read_queue.put((index, item, io.submit(read, item)))
+            finally:
+                read_queue.put(_DONE)
+
+        def writer():
+            for index, item, rendered in iter(write_queue.get, _DONE):
+                try:
+                    output = rendered.result()
+                except Exception as e:
+                    results[index] = (e, None)
+                    continue
+                write_slots.acquire()
+                io.submit(write, item, output).add_done_callback(partial(finish, index))
+
+        threading.Thread(target=reader, daemon=True).start()
+        writer_thread = threading.Thread(target=writer, daemon=True)
+        writer_thread.start()
+        try:
+            for index, item, data in iter(read_queue.get, _DONE):
+                try:
+                    data = data.result()
+                except Exception as e:
+                    write_queue.put((index, item, run_now(_raise, e)))
+                    continue
+                if cpu is not None:
+                    write_queue.put((index, item, cpu.submit(render, item, data)))
+                else:
+                    write_queue.put((index, item, run_now(render, item, data)))
+        finally:
+            write_queue.put(_DONE)
+            writer_thread.join()
+    # leaving the with block waited for the last writes to finish
+    return results
+
+def _raise(error: Exception):
+    raise error
@@ -0,0 +1,166 @@
+from assets import COMPRESSED_SUFFIXES, write_if_changed
+from htmlnode import HTMLNode, leaf_text
+import json
+import re
+from collections import Counter
+from pathlib import Path
+
+SEARCH_DIR = "search"
+SEARCH_INDEX_NAME = "index.json"
+# what each shard of a sharded build knows about its pages, for merge_shards
+SEARCH_DOCUMENTS_NAME = "search-documents.json"
+SEARCH_INDEX_VERSION = 1
+TOKEN_RE = re.compile(r"[^\W_]+")
+STOP_WORDS = frozenset("""
+    a an and are as at be but by for from has have in is it its of on or that the this to was were will with
+""".split())
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+# a term in a heading counts this many times over one in the text
+HEADING_WEIGHT = 3
+# suffix -> replacement, tried in order; the first that leaves a stem of
+# STEM_MIN_LENGTH letters applies. Written into the index for the browser.
+STEM_RULES = (("ies", "y"), ("ied", "y"), ("ings", ""), ("ing", ""), ("edly", ""), ("ed", ""), ("ly", ""),
+              ("s", ""))
+STEM_MIN_LENGTH = 3
+# words ending in these are left alone by the "s" rule (glass, status, analysis)
+STEM_KEEP_ENDINGS = ("ss", "us", "is")
+# shards are grouped by the first letter of their terms until one is this big
+SHARD_TARGET_BYTES = 16 * 1024
+# terms starting with anything but a-z (digits, accented letters)
+OTHER_SHARD = "_"
+
+def stem(word: str):
+    """Strip one common english suffix: searching -> search, libraries -> library."""
+    if word.endswith(STEM_KEEP_ENDINGS):
+        return word
+    for suffix, replacement in STEM_RULES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= STEM_MIN_LENGTH:
+            return word[:-len(suffix)] + replacement
+    return word
+
+def tokenize(text: str, stemmed: bool = False):
+    """The searchable words of text, lowercased and without stop words."""
+    for match in TOKEN_RE.finditer(text.lower()):
+        word = match.group()
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        yield stem(word) if stemmed else word
+
+class PageDocument:
+    """
+    A page's title and the weight of every term in it, filled in block by
+    block as the page is rendered. Plain data once to_json is called, so
+    worker processes can hand it back.
+    """
+    __slots__ = ("title", "terms", "stemmed")
+
+    def __init__(self, title: str = "", stemmed: bool = False):
+        self.title = title
+        self.terms = Counter()
+        self.stemmed = stemmed
+
+    def add_block(self, node: HTMLNode):
+        weight = HEADING_WEIGHT if node.tag in HEADING_TAGS else 1
+        for term in tokenize(" ".join(leaf_text(node)), self.stemmed):
+            self.terms[term] += weight
+
+    def add_page(self, node: HTMLNode):
+        for child in node.children:
+            self.add_block(child)
+
+    def to_json(self):
+        return {"title": self.title, "terms": dict(self.terms)}
+
+def shard_key(term: str):
+    first = term[0]
+    return first if "a" <= first <= "z" else OTHER_SHARD
+
+def index_shards(postings: dict, target_bytes: int = SHARD_TARGET_BYTES):
+    """
+    Group the postings into shards of consecutive first letters, each
+    about target_bytes of json. Terms starting with anything else get a
+    shard of their own. Returns [(first key, last key, postings), ...].
+    """
+    by_key = {}
+    for term in sorted(postings):
+        by_key.setdefault(shard_key(term), {})[term] = postings[term]
+    shards = []
+    if OTHER_SHARD in by_key:
+        other = by_key.pop(OTHER_SHARD)
+        shards.append((OTHER_SHARD, OTHER_SHARD, other))
+    group, size = {}, 0
+    first = None
+    for key in sorted(by_key):
+        if first is None:
+            first = key
+        group.update(by_key[key])
+        size += len(json.dumps(by_key[key], separators=(",", ":")))
+        if size >= target_bytes:
+            shards.append((first, key, group))
+            group, size, first = {}, 0, None
+    if group:
+        shards.append((first, key, group))
+    return shards
+
+def previous_shards(search_dir: Path):
+    """The shard names listed by the index already in search_dir, if there is one."""
+    try:
+        with open(search_dir / SEARCH_INDEX_NAME, "r", encoding="utf-8") as f:
+            return [name for _, _, name in json.load(f)["shards"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return []
+
+def write_search_index(documents: dict, output_dir, stemmed: bool = False,
+                       target_bytes: int = SHARD_TARGET_BYTES):
+    """
+    Write the inverted index of documents ({url: PageDocument.to_json()})
+    to output_dir/search: index.json lists the pages and which shard
+    holds the terms of each first letter, and every shard maps its terms
+    to [[page number, weight], ...], heaviest first. Shards the previous
+    index listed and this one doesn't are removed; anything else in that
+    directory (such as a page built from content/search/) is left alone.
+    Returns the paths written, relative to output_dir.
+    """
+    output_dir = Path(output_dir)
+    search_dir = output_dir / SEARCH_DIR
+    search_dir.mkdir(parents=True, exist_ok=True)
+    previous = previous_shards(search_dir)
+    urls = sorted(documents)
+    postings = {}
+    for number, url in enumerate(urls):
+        for term, weight in documents[url]["terms"].items():
+            postings.setdefault(term, []).append([number, weight])
+    for pages in postings.values():
+        pages.sort(key=lambda posting: (-posting[1], posting[0]))
+
+    shards = []
+    written = set()
+    for first, last, terms in index_shards(postings, target_bytes):
+        name = f"{first}.json" if first == last else f"{first}-{last}.json"
+        write_if_changed(search_dir / name, json.dumps(terms, separators=(",", ":"), ensure_ascii=False))
+        shards.append([first, last, name])
+        written.add(name)
+    index = {
+        "version": SEARCH_INDEX_VERSION,
+        "pages": [[url, documents[url]["title"]] for url in urls],
+        "shards": shards,
+        "stem": {"rules": STEM_RULES, "min_length": STEM_MIN_LENGTH, "keep": STEM_KEEP_ENDINGS} if stemmed else None,
+        "stop_words": sorted(STOP_WORDS),
+    }
+    write_if_changed(search_dir / SEARCH_INDEX_NAME, json.dumps(index, separators=(",", ":"), ensure_ascii=False))
+    written.add(SEARCH_INDEX_NAME)
+    for name in previous:
+        if name not in written:
+            for stale in [name, *(name + suffix for suffix in COMPRESSED_SUFFIXES)]:
+                (search_dir / stale).unlink(missing_ok=True)
+    return [f"{SEARCH_DIR}/{name}" for name in sorted(written)]
+
+def write_search_documents(documents: dict, output_dir):
+    """Write a shard's page documents for merge_shards to index. Returns the name written."""
+    write_if_changed(Path(output_dir) / SEARCH_DOCUMENTS_NAME,
+                     json.dumps(documents, separators=(",", ":"), sort_keys=True, ensure_ascii=False))
+    return SEARCH_DOCUMENTS_NAME
+
+def load_search_documents(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,145 @@
+from utils import UrlResolver
+import re
+from pathlib import Path
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+# the url may run into a placeholder (href="/{{ Slug }}"), which ends the literal
+ROOT_URL_RE = re.compile(r'\b(href|src)="(/(?!/)[^"]*)(?="|$)')
+# elements whose whitespace minify_html must keep
+PRESERVED_ELEMENT_RE = re.compile(r"(<(pre|textarea|script|style)\b.*?</\2\s*>)", re.DOTALL | re.IGNORECASE)
+# a line break between two tags; it only goes away next to a block-level tag,
+# since between inline ones (<a>Home</a>\n<a>Blog</a>) it renders as a space
+TAG_GAP_RE = re.compile(r">\s*\n\s*<")
+TAG_NAME_RE = re.compile(r"</?([a-zA-Z][\w-]*)")
+BLOCK_TAGS = frozenset("""
+    address article aside blockquote body br dd details dialog div dl dt fieldset figcaption figure footer form
+    h1 h2 h3 h4 h5 h6 head header hgroup hr html li link main meta nav noscript ol p pre script section style
+    summary table tbody td tfoot th thead title tr ul
+""".split())
+WHITESPACE_RE = re.compile(r"\s+")
+TEMPLATE_NAME = "template.html"
+
+class Template:
+    """
+    A template compiled once into alternating literal segments and
+    placeholder slots, e.g. "<title>{{ Title }}</title>" becomes
+    literals ["<title>", "</title>"] and slots ["Title"]. urls are the
+    root-relative href and src urls in the literals as written, before any
+    rewriting.
+    """
+    def __init__(self, text: str):
+        self.literals = []
+        self.slots = []
+        self.placeholders = []
+        pos = 0
+        for match in PLACEHOLDER_RE.finditer(text):
+            self.literals.append(text[pos:match.start()])
+            self.slots.append(match.group(1))
+            self.placeholders.append(match.group(0))
+            pos = match.end()
+        self.literals.append(text[pos:])
+        self.urls = [match.group(2) for literal in self.literals for match in ROOT_URL_RE.finditer(literal)]
+
+    def rewritten(self, rewrite):
+        """A copy of this template with rewrite applied to every literal segment."""
+        template = Template("")
+        template.literals = [rewrite(literal) for literal in self.literals]
+        template.slots = list(self.slots)
+        template.placeholders = list(self.placeholders)
+        template.urls = list(self.urls)
+        return template
+
+    def iter_render(self, values: dict):
+        """
+        Yield the rendered page in chunks. Values with an iter_html method
+        (html nodes) are streamed, strings are used as they are, any other
+        iterable (a list, a generator) is taken as already rendered chunks,
+        and placeholders without a value are left as they are.
+        """
+        yield self.literals[0]
+        for name, placeholder, literal in zip(self.slots, self.placeholders, self.literals[1:]):
+            value = values.get(name)
+            if value is None:
+                yield placeholder
+            elif hasattr(value, "iter_html"):
+                yield from value.iter_html()
+            elif isinstance(value, str):
+                yield value
+            else:
+                yield from value
+            yield literal
+
+    def render(self, values: dict):
+        return "".join(self.iter_render(values))
+
+def is_block_tag(tag: str):
+    # doctypes and comments count as block-level: nothing renders beside them
+    match = TAG_NAME_RE.match(tag)
+    return match is None or match.group(1).lower() in BLOCK_TAGS
+
+def drop_block_gap(match: re.Match):
+    text = match.string
+    previous = text[text.rfind("<", 0, match.start()) + 1:match.start()]
+    following = text[match.end() - 1:]
+    if is_block_tag("<" + previous) or is_block_tag(following):
+        return "><"
+    return "> <"
+
+def minify_html(html: str):
+    """
+    Drop the line breaks and indentation next to block-level tags and
+    collapse other whitespace runs to one space, outside pre, textarea,
+    script and style. Meant for template literals, so it never looks at
+    page content.
+    """
+    parts = PRESERVED_ELEMENT_RE.split(html)
+    # split() returns text, element, tag name, text, ...; the text next to
+    # an element gets that element's tag so gaps beside it are found too
+    for i in range(0, len(parts), 3):
+        before = f"</{parts[i - 1]}>" if i > 0 else ""
+        after = f"<{parts[i + 2]}" if i + 1 < len(parts) else ""
+        text = WHITESPACE_RE.sub(" ", TAG_GAP_RE.sub(drop_block_gap, before + parts[i] + after))
+        parts[i] = text[len(before):len(text) - len(after)]
+    return "".join(part for i, part in enumerate(parts) if i % 3 != 2)
+
+def rewrite_root_urls(html: str, resolve_url: UrlResolver):
+    return ROOT_URL_RE.sub(lambda match: f'{match.group(1)}="{resolve_url(match.group(2))}', html)
+
+_loaded = {}
+
+def load_template(path, basepath: str = "/", minify: bool = False, fingerprints=None):
+    """
+    Compile a template file with its root-relative href/src urls moved
+    under basepath and onto fingerprinted asset names, if given (and its
+    markup minified, if asked), reusing the compiled copy for as long as
+    the file's size and mtime are unchanged.
+    """
+    path = Path(path)
+    stat = path.stat()
+    stamp = (stat.st_mtime_ns, stat.st_size)
+    key = (path, basepath, minify, fingerprints.key if fingerprints is not None else None)
+    cached = _loaded.get(key)
+    if cached is not None and cached[0] == stamp:
+        return cached[1]
+    with open(path, "r") as f:
+        template = Template(f.read())
+    resolve_url = UrlResolver(basepath, fingerprints)
+    template = template.rewritten(lambda literal: rewrite_root_urls(literal, resolve_url))
+    if minify:
+        template = template.rewritten(minify_html)
+    _loaded[key] = (stamp, template)
+    return template
+
+def find_template(source_path, content_root, default_template):
+    """
+    Use the nearest template.html in the page's directory or any parent
+    directory inside content_root, falling back to the site template.
+    """
+    content_root = Path(content_root)
+    directory = Path(source_path).parent
+    while directory == content_root or content_root in directory.parents:
+        candidate = directory / TEMPLATE_NAME
+        if candidate.is_file():
+            return candidate
+        directory = directory.parent
+    return Path(default_template)
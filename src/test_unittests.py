@@ -1,10 +1,38 @@
+import contextlib
+import gzip
+import io
+import json
+import os
+import subprocess
+import sys
 import unittest
+import unittest.mock
+import tempfile
+import threading
+import time
+from pathlib import Path
 
 from htmlnode import *
 from textnode import *
 from utils import *
 from blocks import *
 from main import *
+from manifest import *
+from cache import *
+from template import *
+from watch import *
+from assets import *
+from profiler import *
+from pipeline import *
+from depgraph import *
+from compress import *
+from fingerprint import *
+from images import *
+import images
+from search import *
+import compress
+import bench
+from bench import CorpusSpec, compare_to_baseline, generate_corpus
 
 
 class TestTextNode(unittest.TestCase):
@@ -31,6 +59,15 @@ class TestTextNode(unittest.TestCase):
         node2 = TextNode("This a text node", TextType.CODE, "http://www.google.com")
         self.assertNotEqual(node, node2)
 
+    def test_text_type_from_value(self):
+        node = TextNode("raw", "bold")
+        self.assertEqual(node.text_type, TextType.BOLD)
+
+    def test_slots(self):
+        self.assertFalse(hasattr(TextNode("a", TextType.TEXT), "__dict__"))
+        self.assertFalse(hasattr(LeafNode("b", "a"), "__dict__"))
+        self.assertFalse(hasattr(ParentNode("p", []), "__dict__"))
+
 class TestSplitNodes(unittest.TestCase):
     def test_single_code(self):
         node = TextNode("This is text with a `code block` word", TextType.TEXT)
@@ -99,6 +136,16 @@ class TestNodeConversions(unittest.TestCase):
         self.assertEqual(html_node.tag, "img")
         self.assertEqual(html_node.to_html(), '<img src="/cool.jpg" alt="neat image here"></img>')
 
+    def test_link_resolved_to_basepath(self):
+        node = TextNode("home", TextType.LINK, "/blog/")
+        html_node = text_node_to_html_node(node, UrlResolver("/site/"))
+        self.assertEqual(html_node.to_html(), '<a href="/site/blog/">home</a>')
+
+    def test_external_image_not_resolved(self):
+        node = TextNode("pic", TextType.IMAGE, "https://example.com/a.png")
+        html_node = text_node_to_html_node(node, UrlResolver("/site/"))
+        self.assertEqual(html_node.props["src"], "https://example.com/a.png")
+
     def test_code(self):
         node = TextNode("this is a 1337 code block", TextType.CODE, "/cool.jpg")
         html_node = text_node_to_html_node(node)
@@ -180,6 +227,25 @@ class TestHTMLNode(unittest.TestCase):
             '<p>Check out this website linked below.<a href="https://www.boot.dev">boot dev</a></p>'
         )
 
+    def test_iter_html_matches_to_html(self):
+        node = ParentNode("div", [
+            ParentNode("p", [LeafNode(None, "text "), LeafNode("a", "link", {"href": "/x"})]),
+            ParentNode("ul", [ParentNode("li", [LeafNode("b", "item")])]),
+        ])
+        chunks = list(node.iter_html())
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual("".join(chunks), node.to_html())
+
+    def test_write_html(self):
+        node = ParentNode("p", [LeafNode("i", "streamed"), LeafNode(None, " text")])
+        sink = io.StringIO()
+        node.write_html(sink)
+        self.assertEqual(sink.getvalue(), "<p><i>streamed</i> text</p>")
+
+    def test_iter_html_missing_children(self):
+        with self.assertRaises(ValueError):
+            ParentNode("p", None).to_html()
+
 class TestExtractions(unittest.TestCase):
     def test_extract_markdown_images(self):
         matches = extract_markdown_images(
@@ -192,6 +258,27 @@ class TestExtractions(unittest.TestCase):
         matches = extract_markdown_links(text)
         self.assertListEqual([("to boot dev", "https://www.boot.dev"), ("to youtube", "https://www.youtube.com/@bootdotdev")], matches)
 
+    def test_extract_pairs_ignore_stray_brackets(self):
+        text = "See (below) and [notes] then [a link](/a) plus ![pic](/p.png) (done)"
+        self.assertListEqual(extract_markdown_links(text), [("a link", "/a")])
+        self.assertListEqual(extract_markdown_images(text), [("pic", "/p.png")])
+
+    def test_extract_pairs_stray_bracket_before_image(self):
+        text = "a [ note ![x](/y.png)"
+        self.assertListEqual(extract_markdown_links(text), [])
+        self.assertListEqual(extract_markdown_images(text), [("x", "/y.png")])
+        self.assertListEqual(split_nodes_link([TextNode(text, TextType.TEXT)]), [TextNode(text, TextType.TEXT)])
+        self.assertListEqual(
+            split_nodes_image([TextNode(text, TextType.TEXT)]),
+            [TextNode("a [ note ", TextType.TEXT), TextNode("x", TextType.IMAGE, "/y.png")],
+        )
+
+    def test_plain_text_skips_tokenizer(self):
+        self.assertEqual(text_to_textnodes("just prose, no markup."), [TextNode("just prose, no markup.", TextType.TEXT)])
+        self.assertEqual(text_to_textnodes(""), [])
+        self.assertFalse(has_inline_markup("a (parenthesised) sentence"))
+        self.assertTrue(has_inline_markup("wow!"))
+
     def test_split_images(self):
         node = TextNode(
             "This is text with an ![image](https://i.imgur.com/zjjcJKZ.png) and another ![second image](https://i.imgur.com/3elNhQu.png)",
@@ -244,6 +331,36 @@ class TestExtractions(unittest.TestCase):
                         ]
         self.assertEqual(nodes, expected_nodes)   
 
+    def test_text_to_nodes_unmatched_delimiter(self):
+        with self.assertRaises(Exception):
+            text_to_textnodes("This has a **dangling bold marker")
+
+    def test_text_to_nodes_many_links(self):
+        text = " ".join(f"[link {i}](/page/{i}) and `code {i}`" for i in range(3000))
+        nodes = text_to_textnodes(text)
+        self.assertEqual(len(nodes), 12000 - 1)
+        self.assertEqual(nodes[-1], TextNode("code 2999", TextType.CODE))
+
+    def test_text_to_nodes_delimiter_in_url(self):
+        nodes = text_to_textnodes("see [the docs](https://example.com/some_page_name) now")
+        self.assertEqual(nodes, [
+                            TextNode("see ", TextType.TEXT),
+                            TextNode("the docs", TextType.LINK, "https://example.com/some_page_name"),
+                            TextNode(" now", TextType.TEXT),
+                        ])
+
+    def test_text_to_nodes_stray_bracket_before_image(self):
+        self.assertEqual(text_to_textnodes("a [ note ![x](/y.png) b"), [
+                            TextNode("a [ note ", TextType.TEXT),
+                            TextNode("x", TextType.IMAGE, "/y.png"),
+                            TextNode(" b", TextType.TEXT),
+                        ])
+        self.assertEqual(text_to_textnodes("[![badge](/b.png)](/target)"), [
+                            TextNode("[", TextType.TEXT),
+                            TextNode("badge", TextType.IMAGE, "/b.png"),
+                            TextNode("](/target)", TextType.TEXT),
+                        ])
+
     def test_markdown_to_blocks(self):
         md = """
 This is **bolded** paragraph
@@ -253,7 +370,7 @@ This is another paragraph with _italic_ text and `code` here\nThis is the same p
 - This is a list
 - with items
             """
-        blocks = markdown_to_blocks(md)
+        blocks = list(markdown_to_blocks(md))
         self.assertEqual(
             blocks,
             [
@@ -263,6 +380,30 @@ This is another paragraph with _italic_ text and `code` here\nThis is the same p
             ],
         )
 
+    def test_markdown_to_blocks_from_lines(self):
+        md = "\n# Title\n\n\n\npara one\nline two\n \n\n- item\n\n"
+        self.assertEqual(list(markdown_to_blocks(io.StringIO(md))), list(markdown_to_blocks(md)))
+
+    def test_iter_blocks_html(self):
+        md = "# Title\n\nSome **bold** text\n\n- a\n- [b](/b)"
+        resolve = UrlResolver("/site/")
+        self.assertEqual("".join(iter_blocks_html(markdown_to_blocks(md), resolve)),
+                         markdown_to_html_node(md, resolve).to_html())
+
+    def test_lex_blocks(self):
+        md = "# Title\n\n> a quote\n> more\n\n1. one\n2. two\n\n- a\n- b\n\n```\ncode\n```\n\nplain\ntext"
+        self.assertEqual(
+            lex_blocks(md),
+            [
+                (BlockType.HEADING, ["# Title"]),
+                (BlockType.QUOTE, ["> a quote", "> more"]),
+                (BlockType.ORDERED_LIST, ["1. one", "2. two"]),
+                (BlockType.UNORDERED_LIST, ["- a", "- b"]),
+                (BlockType.CODE, ["```", "code", "```"]),
+                (BlockType.PARAGRAPH, ["plain", "text"]),
+            ],
+        )
+
     def test_p_block(self):
         block = "asdf  asdf  asdf  asdf  asdf"
         type = block_to_blocktype(block)
@@ -354,6 +495,12 @@ def hello_world():
         self.assertEqual(html,
                          "<div><pre><code>def hello_world():\n    print(\"Hello, world!\")\n    # this is a comment\n    return None\n</code></pre></div>")
 
+    def test_basepath_skips_code_samples(self):
+        md = '[home](/index) and `<a href="/x">`\n\n```\n<img src="/y.png">\n```'
+        html = markdown_to_html_node(md, UrlResolver("/site/")).to_html()
+        self.assertEqual(html, '<div><p><a href="/site/index">home</a> and <code><a href="/x"></code></p>'
+                               '<pre><code><img src="/y.png">\n</code></pre></div>')
+
     def test_quote_block(self):
         md = """
 > this is a blockquote
@@ -403,6 +550,951 @@ def hello_world():
         with self.assertRaises(Exception):
             extract_title(md)
 
+class TestIncrementalBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.content = root / "content"
+        self.dest = root / "docs"
+        self.template = root / "template.html"
+        (self.content / "blog").mkdir(parents=True)
+        self.dest.mkdir()
+        self.template.write_text("<title>{{ Title }}</title>{{ Content }}")
+        (self.content / "index.md").write_text("# Home\n\nWelcome [home](/blog)")
+        (self.content / "blog" / "index.md").write_text("# Blog\n\nFirst post")
+        self.manifest = BuildManifest(root / "manifest.json")
+        self.static = root / "static"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, basepath="/", values=None, options=None):
+        manifest = BuildManifest.load(self.manifest.path)
+        generate_page_recursive(self.content, self.template, self.dest, basepath, manifest, values=values,
+                                static_dir=self.static, options=options)
+        manifest.remove_stale(self.dest)
+        manifest.save()
+        return manifest
+
+    def test_values_only_rebuild_pages_showing_them(self):
+        self.build(values={"Nav": "<ul>one</ul>"})
+        manifest = self.build(values={"Nav": "<ul>two</ul>"})
+        self.assertEqual([entry["reason"] for entry in manifest.pages.values()], [None, None])
+        (self.content / "blog" / "template.html").write_text("{{ Nav }}{{ Content }}")
+        self.build(values={"Nav": "<ul>two</ul>"})
+        manifest = self.build(values={"Nav": "<ul>three</ul>"})
+        self.assertEqual(manifest.pages[str(self.content / "blog" / "index.md")]["reason"],
+                         "shared values (nav) changed")
+        self.assertIsNone(manifest.pages[str(self.content / "index.md")]["reason"])
+        self.assertIn("<ul>three</ul>", (self.dest / "blog" / "index.html").read_text())
+
+    def test_assets_only_rebuild_pages_showing_them(self):
+        (self.static / "images").mkdir(parents=True)
+        image = self.static / "images" / "a.png"
+        image.write_bytes(png_bytes(4, 2))
+        (self.static / "index.css").write_text("body{}")
+        blog = self.content / "blog" / "index.md"
+        blog.write_text("# Blog\n\n![pic](/images/a.png)")
+        (self.content / "blog" / "template.html").write_text('<link href="/index.css">{{ Content }}')
+
+        def build():
+            fingerprints = fingerprint_assets(self.static, None)
+            return self.build(options=RenderOptions(fingerprints=fingerprints,
+                                                    images=plan_images(self.static, [], fingerprints)))
+
+        build()
+        (self.static / "images" / "b.png").write_bytes(png_bytes(8, 8))
+        manifest = build()
+        self.assertEqual([entry["reason"] for entry in manifest.pages.values()], [None, None])
+
+        image.write_bytes(png_bytes(6, 3))
+        manifest = build()
+        self.assertEqual(manifest.pages[str(blog)]["reason"], f"image {image} changed")
+        self.assertIsNone(manifest.pages[str(self.content / "index.md")]["reason"])
+        self.assertIn('width="6" height="3"', (self.dest / "blog" / "index.html").read_text())
+
+        (self.static / "index.css").write_text("body{color:red}")
+        manifest = build()
+        self.assertEqual(manifest.pages[str(blog)]["reason"],
+                         f"template {self.content / 'blog' / 'template.html'} changed")
+        self.assertIsNone(manifest.pages[str(self.content / "index.md")]["reason"])
+
+    def test_date_rebuilds_pages_showing_it(self):
+        (self.content / "blog" / "template.html").write_text("{{ Date }}{{ Content }}")
+        blog = self.content / "blog" / "index.md"
+        os.utime(blog, (1577880000, 1577880000))
+        self.build()
+        self.assertIn("2020-01-01", (self.dest / "blog" / "index.html").read_text())
+        os.utime(blog, (1609502400, 1609502400))
+        os.utime(self.content / "index.md", (1609502400, 1609502400))
+        manifest = self.build()
+        self.assertEqual(manifest.pages[str(blog)]["reason"], "date changed to 2021-01-01")
+        self.assertIsNone(manifest.pages[str(self.content / "index.md")]["reason"])
+        self.assertIn("2021-01-01", (self.dest / "blog" / "index.html").read_text())
+
+    def test_unchanged_pages_are_skipped(self):
+        self.build()
+        page = self.dest / "blog" / "index.html"
+        page.write_text("sentinel")
+        self.build()
+        self.assertEqual(page.read_text(), "sentinel")
+
+    def test_changed_source_is_rebuilt(self):
+        self.build()
+        (self.content / "blog" / "index.md").write_text("# Blog\n\nSecond post")
+        self.build()
+        self.assertIn("Second post", (self.dest / "blog" / "index.html").read_text())
+
+    def test_template_and_basepath_changes_rebuild(self):
+        self.build()
+        self.build(basepath="/site/")
+        self.assertIn('href="/site/blog"', (self.dest / "index.html").read_text())
+        self.template.write_text("<h1>{{ Title }}</h1>{{ Content }}")
+        self.build(basepath="/site/")
+        self.assertIn("<h1>Blog</h1>", (self.dest / "blog" / "index.html").read_text())
+
+    def test_removed_source_deletes_output(self):
+        self.build()
+        (self.content / "blog" / "index.md").unlink()
+        self.build()
+        self.assertFalse((self.dest / "blog" / "index.html").exists())
+        self.assertFalse((self.dest / "blog").exists())
+        self.assertTrue((self.dest / "index.html").exists())
+
+    def test_summary_counts_built_and_skipped(self):
+        self.build()
+        (self.content / "blog" / "index.md").write_text("# Blog\n\nSecond post")
+        manifest = BuildManifest.load(self.manifest.path)
+        summary = generate_page_recursive(self.content, self.template, self.dest, "/", manifest,
+                                          static_dir=self.static)
+        self.assertEqual((summary.pages_built, summary.pages_skipped), (1, 1))
+        self.assertEqual(summary.bytes_written, (self.dest / "blog" / "index.html").stat().st_size)
+
+    def test_dependencies_invalidate_exact_pages(self):
+        (self.static / "images").mkdir(parents=True)
+        (self.static / "images" / "a.png").write_bytes(b"png")
+        (self.content / "blog" / "index.md").write_text("# Blog\n\n![pic](/images/a.png)")
+        (self.content / "blog" / "template.html").write_text("<h1>{{ Title }}</h1>{{ Content }}")
+        manifest = self.build()
+        self.assertEqual(manifest.dependents(self.static / "images" / "a.png"), [str(self.content / "blog" / "index.md")])
+        self.assertEqual(manifest.dependents(self.content / "blog" / "index.md"), [str(self.content / "index.md")])
+
+        # a new version of the image doesn't change the html linking to it
+        (self.static / "images" / "a.png").write_bytes(b"png, retouched")
+        manifest = self.build()
+        self.assertIsNone(manifest.pages[str(self.content / "blog" / "index.md")]["reason"])
+
+        (self.static / "images" / "a.png").rename(self.static / "images" / "b.png")
+        manifest = self.build()
+        blog = manifest.pages[str(self.content / "blog" / "index.md")]
+        self.assertEqual(blog["reason"], f"image {self.static / 'images' / 'a.png'} was removed")
+        self.assertIsNone(manifest.pages[str(self.content / "index.md")]["reason"])
+
+        self.template.write_text("<h2>{{ Title }}</h2>{{ Content }}")
+        manifest = self.build()
+        self.assertEqual(manifest.pages[str(self.content / "index.md")]["reason"], f"template {self.template} changed")
+        self.assertIsNone(manifest.pages[str(self.content / "blog" / "index.md")]["reason"])
+        self.assertIn(f"Rebuilt in the last build: template {self.template} changed",
+                      explain_rebuild(manifest, self.dest / "index.html"))
+
+    def test_identical_output_is_not_rewritten(self):
+        self.build()
+        page = self.dest / "blog" / "index.html"
+        os.utime(page, (0, 0))
+        # the template changes but renders the same html for this page
+        self.template.write_text("<title>{{Title}}</title>{{Content}}")
+        manifest = BuildManifest.load(self.manifest.path)
+        summary = generate_page_recursive(self.content, self.template, self.dest, "/", manifest,
+                                          static_dir=self.static)
+        self.assertEqual((summary.pages_built, summary.pages_unchanged), (2, 2))
+        self.assertEqual(page.stat().st_mtime, 0)
+
+    def test_write_page_compares_existing_file(self):
+        dest = self.dest / "page.html"
+        self.assertEqual(write_page("page.md", dest, ["<p>", "hi", "</p>"], skip_unchanged=True)[0], 9)
+        os.utime(dest, (0, 0))
+        written, digest = write_page("page.md", dest, ["<p>hi</p>"], skip_unchanged=True)
+        self.assertEqual((written, digest), (0, hash_bytes(b"<p>hi</p>")))
+        self.assertEqual(dest.stat().st_mtime, 0)
+        self.assertEqual(write_page("page.md", dest, ["<p>ho</p>"], skip_unchanged=True)[0], 9)
+        self.assertEqual(dest.read_text(), "<p>ho</p>")
+        # chunks are written as they come, so a generator works too
+        written, digest = write_page("page.md", dest, (chunk for chunk in ["<p>", "hé", "</p>"]), skip_unchanged=True)
+        self.assertEqual((written, digest), (10, hash_bytes("<p>hé</p>".encode())))
+        self.assertEqual(list(self.dest.glob("*.tmp")), [])
+
+class TestDependencies(unittest.TestCase):
+    def test_page_url(self):
+        self.assertEqual(page_url(Path("content/index.md"), Path("content")), "/")
+        self.assertEqual(page_url(Path("content/blog/tom/index.md"), Path("content")), "/blog/tom/")
+        self.assertEqual(page_url(Path("content/about.md"), Path("content")), "/about.html")
+
+    def test_local_url_path(self):
+        self.assertEqual(local_url_path("/images/a.png", "/blog/"), "images/a.png")
+        self.assertEqual(local_url_path("a.png#top", "/blog/tom/"), "blog/tom/a.png")
+        self.assertEqual(local_url_path("../", "/blog/tom/"), "blog")
+        self.assertIsNone(local_url_path("https://example.com/a.png", "/"))
+        self.assertIsNone(local_url_path("#section", "/"))
+
+    def test_page_dependencies(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            content, static = Path(tmp) / "content", Path(tmp) / "static"
+            (content / "blog").mkdir(parents=True)
+            (content / "blog" / "index.md").write_text("# Blog")
+            markdown = "# Home (draft)\n\n[blog](/blog) ![x](/a.png) [out](https://x.org) [gone](/old)"
+            deps = page_dependencies(content / "index.md", markdown, "template.html", content, static)
+        self.assertEqual(deps, {
+            "template.html": "template",
+            str(content / "blog" / "index.md"): "page",
+            str(static / "a.png"): "image",
+            str(content / "old" / "index.md"): "page",
+        })
+
+class TestStreamingBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.template = self.root / "template.html"
+        self.template.write_text("<title>{{ Title }}</title><meta content=\"{{ Description }}\">{{ Content }}")
+        self.source = self.root / "big.md"
+        sections = [f"## Section {i}\n\nText with a [link](/s{i}) and `code`\n\n- a\n- b" for i in range(2000)]
+        self.source.write_text("# Reference\n\n> intro\n\nThe first paragraph\n\n" + "\n\n".join(sections))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_streamed_page_matches_regular_page(self):
+        generate_page(self.source, self.template, self.root / "regular.html", "/site/")
+        generate_page(self.source, self.template, self.root / "streamed.html", "/site/", stream_threshold=0)
+        self.assertEqual((self.root / "streamed.html").read_text(), (self.root / "regular.html").read_text())
+
+    def test_streaming_memory_is_bounded_by_block(self):
+        import tracemalloc
+        tracemalloc.start()
+        written, digest = stream_page(self.source, self.template, self.root / "out.html", "/", skip_unchanged=True)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, written / 4)
+        self.assertEqual(stream_page(self.source, self.template, self.root / "out.html", "/",
+                                     skip_unchanged=True), (0, digest))
+
+    def test_minified_stream_matches_minified_page(self):
+        options = RenderOptions(minify=True)
+        generate_page(self.source, self.template, self.root / "regular.html", "/", options=options)
+        generate_page(self.source, self.template, self.root / "streamed.html", "/", stream_threshold=0,
+                      options=options)
+        self.assertEqual((self.root / "streamed.html").read_text(), (self.root / "regular.html").read_text())
+
+class TestMinify(unittest.TestCase):
+    def test_minify_node_keeps_code(self):
+        node = markdown_to_html_node("Some   text\nover two lines\n\n```\nkeep   this\n  indented\n```")
+        minify_node(node)
+        self.assertEqual(node.to_html(), "<div><p>Some text over two lines</p>"
+                                         "<pre><code>keep   this\n  indented\n</code></pre></div>")
+
+    def test_minify_html_keeps_preserved_elements(self):
+        html = "<div>\n  <pre>a\n   b</pre>\n  <b>x</b>   <i>y</i>\n<script>if (a)\n  b();</script>\n</div>\n"
+        self.assertEqual(minify_html(html),
+                         "<div><pre>a\n   b</pre><b>x</b> <i>y</i><script>if (a)\n  b();</script></div> ")
+
+    def test_minify_html_keeps_space_between_inline_tags(self):
+        html = "<nav>\n  <a>Home</a>\n  <a>Blog</a>\n</nav>\n<textarea>x</textarea>\n<b>y</b>"
+        self.assertEqual(minify_html(html), "<nav><a>Home</a> <a>Blog</a></nav><textarea>x</textarea> <b>y</b>")
+
+    def test_minified_page_is_smaller_and_rebuilds(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "content").mkdir()
+            (root / "docs").mkdir()
+            (root / "content" / "index.md").write_text("# Home\n\nSome   spaced\ntext\n\n```\na   b\n```")
+            template = root / "template.html"
+            template.write_text("<html>\n  <body>\n    {{ Content }}\n  </body>\n</html>\n")
+            manifest = BuildManifest.load(root / "manifest.json")
+            generate_page_recursive(root / "content", template, root / "docs", "/", manifest)
+            plain = (root / "docs" / "index.html").read_text()
+            generate_page_recursive(root / "content", template, root / "docs", "/", manifest,
+                                    options=RenderOptions(minify=True))
+            minified = (root / "docs" / "index.html").read_text()
+            self.assertLess(len(minified), len(plain))
+            self.assertIn("<p>Some spaced text</p>", minified)
+            self.assertIn("<pre><code>a   b\n</code></pre>", minified)
+            self.assertEqual(manifest.pages[str(root / "content" / "index.md")]["reason"],
+                             "render options changed")
+
+class TestParallelBuild(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.content = self.root / "content"
+        self.template = self.root / "template.html"
+        self.template.write_text("<title>{{ Title }}</title>{{ Content }}")
+        for i in range(6):
+            page_dir = self.content / f"page{i}"
+            page_dir.mkdir(parents=True)
+            (page_dir / "index.md").write_text(f"# Page {i}\n\nBody with a [link](/page{i}) here")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def build(self, dest, workers):
+        dest.mkdir()
+        generate_page_recursive(self.content, self.template, dest, "/base/", workers=workers)
+        return {p.relative_to(dest): p.read_text() for p in dest.rglob("*.html")}
+
+    def test_collect_jobs_is_sorted(self):
+        dest = self.root / "docs"
+        dest.mkdir()
+        jobs = collect_page_jobs(self.content, dest)
+        self.assertEqual([src.parent.name for src, _ in jobs], [f"page{i}" for i in range(6)])
+
+    def test_parallel_matches_sequential(self):
+        sequential = self.build(self.root / "seq", workers=1)
+        parallel = self.build(self.root / "par", workers=3)
+        self.assertEqual(len(sequential), 6)
+        self.assertEqual(sequential, parallel)
+
+    def test_errors_are_aggregated(self):
+        (self.content / "page1" / "index.md").write_text("no title here")
+        (self.content / "page4" / "index.md").write_text("## wrong heading")
+        dest = self.root / "docs"
+        dest.mkdir()
+        with self.assertRaises(PageBuildError) as ctx:
+            generate_page_recursive(self.content, self.template, dest, "/", workers=2)
+        self.assertEqual([src.parent.name for src, _ in ctx.exception.failures], ["page1", "page4"])
+        self.assertTrue((dest / "page5" / "index.html").exists())
+
+def pipeline_render(item, data):
+    if item == 3:
+        raise ValueError("bad item")
+    return data * 10
+
+class TestPipeline(unittest.TestCase):
+    def test_results_keep_order_and_errors(self):
+        results = run_pipeline(range(6), lambda item: item + 1, pipeline_render, lambda item, out: out + item)
+        self.assertEqual([result for _, result in results], [10, 21, 32, None, 54, 65])
+        self.assertIsInstance(results[3][0], ValueError)
+
+    def test_process_pool_render(self):
+        results = run_pipeline(range(4), lambda item: item, pipeline_render, lambda item, out: out, workers=2)
+        self.assertEqual([result for _, result in results], [0, 10, 20, None])
+
+    def test_reads_are_held_back_by_slow_writes(self):
+        lock = threading.Lock()
+        state = {"read": 0, "written": 0, "ahead": 0}
+
+        def read(item):
+            with lock:
+                state["read"] += 1
+                state["ahead"] = max(state["ahead"], state["read"] - state["written"])
+
+        def write(item, output):
+            time.sleep(0.001)
+            with lock:
+                state["written"] += 1
+
+        run_pipeline(range(200), read, lambda item, data: data, write, io_threads=2, depth=4)
+        self.assertEqual(state["written"], 200)
+        # two bounded queues, plus one item in each stage and the write slots
+        self.assertLessEqual(state["ahead"], 4 * 3 + 3)
+
+class TestLogging(unittest.TestCase):
+    def setUp(self):
+        root = logging.getLogger()
+        self.saved = (root.handlers[:], root.level)
+
+    def tearDown(self):
+        root = logging.getLogger()
+        root.handlers[:] = self.saved[0]
+        root.setLevel(self.saved[1])
+
+    def test_default_only_logs_info(self):
+        out = io.StringIO()
+        configure_logging(stream=out)
+        logging.getLogger("build").debug("Generating page")
+        logging.getLogger("build").info("Built 1 pages")
+        self.assertEqual(out.getvalue(), "Built 1 pages\n")
+
+    def test_verbose_output_is_buffered(self):
+        out = io.StringIO()
+        handler = configure_logging(verbose=True, stream=out)
+        logging.getLogger("build").debug("Generating page")
+        self.assertEqual(out.getvalue(), "")
+        handler.flush()
+        self.assertEqual(out.getvalue(), "[DEBUG] build: Generating page\n")
+
+    def test_unbuffered_verbose_output_is_immediate(self):
+        out = io.StringIO()
+        configure_logging(verbose=True, stream=out, buffered=False)
+        logging.getLogger("watch").info("Rebuilt 1 change(s)")
+        self.assertEqual(out.getvalue(), "[INFO] watch: Rebuilt 1 change(s)\n")
+
+    def test_quiet_drops_summary(self):
+        out = io.StringIO()
+        configure_logging(quiet=True, stream=out)
+        logging.getLogger("main").info("Built 1 pages")
+        self.assertEqual(out.getvalue(), "")
+
+class TestASTCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = ASTCache(Path(self.tmp.name) / "ast")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        md = "# Title\n\nSome **bold** text and a [link](/x)"
+        self.assertIsNone(self.cache.get(md))
+        node = self.cache.parse(md)
+        cached = self.cache.get(md)
+        self.assertIsNot(cached, node)
+        self.assertEqual(cached.to_html(), markdown_to_html_node(md).to_html())
+
+    def test_corrupt_entry_is_a_miss(self):
+        md = "# Title"
+        self.cache.parse(md)
+        self.cache.entry_path(self.cache.key(md)).write_bytes(b"not a pickle")
+        self.assertIsNone(self.cache.get(md))
+
+    def test_evicts_least_recently_used(self):
+        pages = [f"# Page {i}\n\n" + "words " * 200 for i in range(3)]
+        for i, md in enumerate(pages):
+            self.cache.put(md, markdown_to_html_node(md))
+            path = self.cache.entry_path(self.cache.key(md))
+            os.utime(path, (1000 + i, 1000 + i))
+        self.cache.get(pages[0])
+        entry_size = self.cache.entry_path(self.cache.key(pages[1])).stat().st_size
+        self.cache.max_bytes = entry_size * 2 + entry_size // 2
+        removed = self.cache.evict()
+        self.assertEqual(removed, [self.cache.entry_path(self.cache.key(pages[1]))])
+        self.assertIsNotNone(self.cache.get(pages[0]))
+
+class TestTemplate(unittest.TestCase):
+    def test_compile(self):
+        template = Template("<title>{{ Title }}</title><body>{{Content}}</body>")
+        self.assertEqual(template.literals, ["<title>", "</title><body>", "</body>"])
+        self.assertEqual(template.slots, ["Title", "Content"])
+
+    def test_render_with_node_and_missing_value(self):
+        template = Template("<h1>{{ Title }}</h1>{{ Content }}<p>{{ Unknown }}</p>")
+        content = ParentNode("div", [LeafNode("b", "body")])
+        self.assertEqual(
+            template.render({"Title": "Hi", "Content": content}),
+            "<h1>Hi</h1><div><b>body</b></div><p>{{ Unknown }}</p>",
+        )
+
+    def test_load_template_applies_basepath(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "template.html"
+            path.write_text('<link href="/index.css"><a href="//cdn.example.com/x">{{ Content }}</a>')
+            template = load_template(path, "/site/")
+            self.assertEqual(template.render({"Content": 'href="/"'}),
+                             '<link href="/site/index.css"><a href="//cdn.example.com/x">href="/"</a>')
+
+    def test_find_template_override(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp) / "content"
+            (root / "blog" / "post").mkdir(parents=True)
+            (root / "other").mkdir()
+            (root / "blog" / "template.html").write_text("blog")
+            default = Path(tmp) / "template.html"
+            self.assertEqual(find_template(root / "blog" / "post" / "index.md", root, default),
+                             root / "blog" / "template.html")
+            self.assertEqual(find_template(root / "other" / "index.md", root, default), default)
+
+    def test_load_template_reloads_on_change(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "template.html"
+            path.write_text("{{ Title }}")
+            first = load_template(path)
+            self.assertIs(load_template(path), first)
+            path.write_text("<b>{{ Title }}</b>!")
+            self.assertEqual(load_template(path).render({"Title": "x"}), "<b>x</b>!")
+
+    def test_extract_description(self):
+        node = markdown_to_html_node("# Title\n\nSome **bold** words & a [link](/x).\n\nSecond")
+        self.assertEqual(extract_description(node), "Some bold words &amp; a link.")
+
+    def test_build_nav(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            (root / "blog").mkdir()
+            (root / "blog" / "index.md").write_text("# The Blog\n\nposts")
+            (root / "empty").mkdir()
+            self.assertEqual(build_nav(root), '<ul><li><a href="/blog/">The Blog</a></li></ul>')
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        (self.root / "content" / "blog").mkdir(parents=True)
+        self.page = self.root / "content" / "blog" / "index.md"
+        self.page.write_text("# Blog")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_detects_edit(self, watcher):
+        self.page.write_text("# Blog\n\nedited")
+        self.assertIn(self.page, watcher.wait())
+
+    def test_polling_watcher(self):
+        self.assert_detects_edit(PollingWatcher([self.root / "content"], interval=0.01))
+
+    def test_make_watcher(self):
+        self.assert_detects_edit(make_watcher([self.root / "content", self.root / "missing"]))
+
+    def test_inotify_watches_new_directories(self):
+        try:
+            watcher = InotifyWatcher([self.root / "content"])
+        except (OSError, AttributeError, TypeError):
+            self.skipTest("inotify not available")
+        new_dir = self.root / "content" / "new"
+        new_dir.mkdir()
+        watcher.wait()
+        page = new_dir / "index.md"
+        page.write_text("# New")
+        self.assertIn(page, watcher.wait())
+
+    def test_live_reload_wait(self):
+        reload = LiveReload()
+        self.assertEqual(reload.wait(0, timeout=0.01), 0)
+        threading.Timer(0.01, reload.bump).start()
+        self.assertEqual(reload.wait(0, timeout=5), 1)
+
+class TestAssetSync(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.static = root / "static"
+        self.dest = root / "docs"
+        (self.static / "images").mkdir(parents=True)
+        (self.static / "index.css").write_text("body {}")
+        (self.static / "images" / "a.png").write_bytes(b"\x89PNG" * 100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_unchanged_assets_are_not_copied(self):
+        assets, copied = sync_assets(self.static, self.dest)
+        self.assertEqual(assets, ["images/a.png", "index.css"])
+        self.assertEqual(copied, 400 + 7)
+        self.assertEqual((self.dest / "images" / "a.png").read_bytes(), b"\x89PNG" * 100)
+        assets, copied = sync_assets(self.static, self.dest, previous=assets)
+        self.assertEqual(copied, 0)
+
+    def test_changed_asset_is_copied(self):
+        sync_assets(self.static, self.dest)
+        css = self.static / "index.css"
+        css.write_text("body { color: red }")
+        os.utime(css, (css.stat().st_atime + 10, css.stat().st_mtime + 10))
+        _, copied = sync_assets(self.static, self.dest)
+        self.assertEqual(copied, len("body { color: red }"))
+        self.assertEqual((self.dest / "index.css").read_text(), "body { color: red }")
+
+    def test_same_size_edit_within_a_second_is_copied(self):
+        js = self.static / "app.js"
+        js.write_text("var a=1;")
+        os.utime(js, ns=(10_100_000_000, 10_100_000_000))
+        sync_assets(self.static, self.dest)
+        js.write_text("var a=2;")
+        os.utime(js, ns=(10_700_000_000, 10_700_000_000))
+        sync_assets(self.static, self.dest)
+        self.assertEqual((self.dest / "app.js").read_text(), "var a=2;")
+
+    def test_stale_assets_are_removed(self):
+        assets, _ = sync_assets(self.static, self.dest)
+        (self.static / "images" / "a.png").unlink()
+        sync_assets(self.static, self.dest, previous=assets)
+        self.assertFalse((self.dest / "images").exists())
+        self.assertTrue((self.dest / "index.css").exists())
+
+    def test_hardlink_mode(self):
+        sync_assets(self.static, self.dest, mode="hardlink")
+        self.assertTrue(os.path.samefile(self.static / "index.css", self.dest / "index.css"))
+        # recopying must replace the link rather than write through it
+        copy_file(self.static / "index.css", self.dest / "index.css")
+        (self.dest / "index.css").write_text("changed")
+        self.assertEqual((self.static / "index.css").read_text(), "body {}")
+
+    def test_reflink_mode_falls_back_to_copy(self):
+        sync_assets(self.static, self.dest, mode="reflink")
+        self.assertEqual((self.dest / "index.css").read_text(), "body {}")
+
+    def test_prune_output_keeps_listed_files(self):
+        out = Path(self.tmp.name) / "out"
+        (out / "old").mkdir(parents=True)
+        (out / "old" / "gone.html").write_text("x")
+        (out / "index.html").write_text("x")
+        removed = prune_output(out, {out / "index.html"})
+        self.assertEqual(removed, [out / "old" / "gone.html"])
+        self.assertEqual(sorted(p.name for p in out.iterdir()), ["index.html"])
+
+class TestPrecompress(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.out = Path(self.tmp.name) / "docs"
+        self.state = Path(self.tmp.name) / "compress.json"
+        (self.out / "blog").mkdir(parents=True)
+        (self.out / "index.html").write_text("<p>hello</p>" * 100)
+        (self.out / "blog" / "index.html").write_text("<p>blog</p>" * 100)
+        (self.out / "tiny.css").write_text("a{}")
+        (self.out / "image.png").write_bytes(b"\x89PNG" * 100)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_siblings_are_written_once(self):
+        self.assertEqual(precompress(self.out, self.state), (2, 0))
+        self.assertEqual(gzip.decompress((self.out / "index.html.gz").read_bytes()),
+                         (self.out / "index.html").read_bytes())
+        self.assertFalse((self.out / "tiny.css.gz").exists())
+        self.assertFalse((self.out / "image.png.gz").exists())
+        # rewritten with the same content: hashed again but not recompressed
+        (self.out / "index.html").write_text("<p>hello</p>" * 100)
+        self.assertEqual(precompress(self.out, self.state), (0, 2))
+        (self.out / "index.html").write_text("<p>changed</p>" * 100)
+        self.assertEqual(precompress(self.out, self.state), (1, 1))
+
+    def test_siblings_follow_their_file(self):
+        precompress(self.out, self.state)
+        (self.out / "blog" / "index.html").unlink()
+        precompress(self.out, self.state)
+        self.assertFalse((self.out / "blog" / "index.html.gz").exists())
+        prune_output(self.out, {self.out / "index.html"})
+        self.assertTrue((self.out / "index.html.gz").exists())
+
+    def test_file_shrunk_below_minimum_loses_siblings(self):
+        precompress(self.out, self.state)
+        (self.out / "blog" / "index.html").write_text("<p>blog</p>")
+        self.assertEqual(precompress(self.out, self.state), (0, 1))
+        self.assertFalse((self.out / "blog" / "index.html.gz").exists())
+        self.assertNotIn(str(self.out / "blog" / "index.html"), json.loads(self.state.read_text()))
+
+    @unittest.skipIf(compress.brotli is None, "brotli is not installed")
+    def test_brotli_siblings(self):
+        precompress(self.out, self.state)
+        self.assertTrue((self.out / "index.html.br").exists())
+
+class TestFingerprint(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.static = self.root / "static"
+        (self.static / "images").mkdir(parents=True)
+        (self.static / "index.css").write_text("body{}")
+        (self.static / "images" / "tom.png").write_bytes(b"\x89PNG")
+        (self.static / "robots.txt").write_text("User-agent: *")
+        self.state = self.root / "fingerprints.json"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_names_follow_content(self):
+        fingerprints = fingerprint_assets(self.static, self.state)
+        css = fingerprints.get("index.css")
+        self.assertRegex(css, r"^index\.[0-9a-f]{12}\.css$")
+        self.assertIsNone(fingerprints.get("robots.txt"))
+        self.assertEqual(fingerprint_assets(self.static, self.state).key, fingerprints.key)
+        (self.static / "index.css").write_text("body{color:red}")
+        changed = fingerprint_assets(self.static, self.state)
+        self.assertNotEqual(changed.get("index.css"), css)
+        self.assertNotEqual(changed.key, fingerprints.key)
+
+    def test_assets_are_copied_under_their_fingerprints(self):
+        fingerprints = fingerprint_assets(self.static, None)
+        out = self.root / "docs"
+        out.mkdir()
+        assets, _ = sync_assets(self.static, out, names=fingerprints.names)
+        self.assertEqual(sorted(assets), sorted([fingerprints.get("index.css"), fingerprints.get("images/tom.png"),
+                                                 "robots.txt"]))
+        self.assertTrue((out / fingerprints.get("images/tom.png")).is_file())
+        fingerprints.write_manifest(out)
+        self.assertEqual(json.loads((out / ASSET_MANIFEST_NAME).read_text()), fingerprints.names)
+
+    def test_links_point_at_fingerprints(self):
+        fingerprints = fingerprint_assets(self.static, None)
+        resolve_url = UrlResolver("/site/", fingerprints)
+        png = fingerprints.get("images/tom.png")
+        self.assertEqual(resolve_url("/images/tom.png?v=1#top"), f"/site/{png}?v=1#top")
+        self.assertEqual(resolve_url("/blog/tom"), "/site/blog/tom")
+        markdown = "![Tom](/images/tom.png)"
+        self.assertNotEqual(resolve_url.cache_key(markdown), UrlResolver("/site/").cache_key(markdown))
+        # a new asset the page doesn't use leaves its parsed tree valid
+        (self.static / "images" / "jerry.png").write_bytes(b"\x89PNG")
+        more = UrlResolver("/site/", fingerprint_assets(self.static, None))
+        self.assertEqual(more.cache_key(markdown), resolve_url.cache_key(markdown))
+        self.assertNotEqual(more.cache_key("![Jerry](/images/jerry.png)"),
+                            resolve_url.cache_key("![Jerry](/images/jerry.png)"))
+
+        template = self.root / "template.html"
+        template.write_text('<link href="/index.css"><a href="/{{ Title }}">x</a>{{ Content }}')
+        source = self.root / "index.md"
+        source.write_text("# Tom\n\n![Tom](/images/tom.png) and [a link](/robots.txt)")
+        generate_page(source, template, self.root / "index.html", "/site/",
+                      options=RenderOptions(fingerprints=fingerprints))
+        html = (self.root / "index.html").read_text()
+        self.assertIn(f'<link href="/site/{fingerprints.get("index.css")}">', html)
+        self.assertIn('<a href="/site/Tom">', html)
+        self.assertIn(f'src="/site/{png}"', html)
+        self.assertIn('href="/site/robots.txt"', html)
+
+def png_bytes(width, height):
+    """A valid grey PNG of the given size."""
+    import struct
+    import zlib
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    rows = b"".join(b"\0" + b"\x80" * width for _ in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+class TestResponsiveImages(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.static = self.root / "static"
+        (self.static / "images").mkdir(parents=True)
+        (self.static / "images" / "wide.png").write_bytes(png_bytes(1000, 500))
+        (self.static / "images" / "small.png").write_bytes(png_bytes(300, 200))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_image_size_from_header(self):
+        self.assertEqual(tuple(image_size(self.static / "images" / "wide.png")), (1000, 500))
+        (self.static / "notes.png").write_text("not an image")
+        self.assertIsNone(image_size(self.static / "notes.png"))
+
+    @unittest.skipIf(images.Image is None, "Pillow is not installed")
+    def test_img_gets_size_and_srcset(self):
+        plan = plan_images(self.static, [480, 800])
+        self.assertEqual(plan.entries["images/small.png"], [300, 200, "images/small.png", []])
+        resolve_url = UrlResolver("/site/", images=plan)
+        node = text_node_to_html_node(TextNode("wide", TextType.IMAGE, "/images/wide.png"), resolve_url)
+        self.assertEqual(node.props["width"], "1000")
+        self.assertEqual(node.props["height"], "500")
+        self.assertEqual(node.props["srcset"], "/site/images/wide.480w.png 480w, /site/images/wide.800w.png 800w, "
+                                               "/site/images/wide.png 1000w")
+        node = text_node_to_html_node(TextNode("small", TextType.IMAGE, "/images/small.png"), resolve_url)
+        self.assertNotIn("srcset", node.props)
+        self.assertEqual(node.props["width"], "300")
+
+    @unittest.skipIf(images.Image is None, "Pillow is not installed")
+    def test_derivatives_are_cached_by_content(self):
+        plan = plan_images(self.static, [480])
+        out, cache, state = self.root / "docs", self.root / "cache", self.root / "images.json"
+        names, copied = write_derivatives(plan, self.static, out, cache_dir=cache, state_path=state)
+        self.assertEqual(names, ["images/wide.480w.png"])
+        self.assertEqual(tuple(image_size(out / "images" / "wide.480w.png")), (480, 240))
+        cached = next(cache.iterdir())
+        mtime = cached.stat().st_mtime_ns
+        self.assertEqual(write_derivatives(plan, self.static, out, cache_dir=cache, state_path=state), (names, 0))
+        self.assertEqual(cached.stat().st_mtime_ns, mtime)
+        (self.static / "images" / "wide.png").write_bytes(png_bytes(1000, 400))
+        write_derivatives(plan_images(self.static, [480]), self.static, out, cache_dir=cache, state_path=state)
+        self.assertEqual(len(list(cache.iterdir())), 2)
+        self.assertEqual(tuple(image_size(out / "images" / "wide.480w.png")), (480, 192))
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tokenize_and_stem(self):
+        self.assertEqual(list(tokenize("The Searching of Libraries, and glass_jars!")),
+                         ["searching", "libraries", "glass", "jars"])
+        self.assertEqual(list(tokenize("The Searching of Libraries and glass", stemmed=True)),
+                         ["search", "library", "glass"])
+        self.assertEqual(stem("is"), "is")
+
+    def test_page_document_weights_headings(self):
+        source = self.root / "index.md"
+        source.write_text("# Search Guide\n\nSearch the **guide** for ![an image](/x.png) words\n\n## Words")
+        template = self.root / "template.html"
+        template.write_text("{{ Content }}")
+        document = PageDocument()
+        render_page(source, source.read_text(), "2024-01-01", template, "/", document=document)
+        self.assertEqual(document.title, "Search Guide")
+        self.assertEqual(document.terms, {"search": 4, "guide": 4, "words": 4})
+        streamed = PageDocument()
+        stream_page(source, template, self.root / "index.html", "/", document=streamed)
+        self.assertEqual(streamed.to_json(), document.to_json())
+
+    def test_shards_by_first_letter(self):
+        postings = {term: [[0, 1]] for term in ("apple", "avocado", "banana", "cherry", "zebra", "2024", "éclair")}
+        shards = index_shards(postings, target_bytes=30)
+        self.assertEqual([(first, last) for first, last, _ in shards], [("_", "_"), ("a", "a"), ("b", "c"), ("z", "z")])
+        self.assertEqual(sorted(shards[0][2]), ["2024", "éclair"])
+
+    def test_index_files(self):
+        documents = {
+            "/": {"title": "Home", "terms": {"tolkien": 1, "hobbit": 2}},
+            "/blog/": {"title": "Blog", "terms": {"tolkien": 3}},
+        }
+        out = self.root / "docs"
+        write_search_index({"/": {"title": "Home", "terms": {"old": 1}}}, out, target_bytes=1)
+        (out / SEARCH_DIR / "o.json.gz").write_bytes(b"")
+        written = write_search_index(documents, out, target_bytes=1)
+        self.assertEqual(written, ["search/h.json", "search/index.json", "search/t.json"])
+        self.assertFalse((out / SEARCH_DIR / "o.json").exists())
+        self.assertFalse((out / SEARCH_DIR / "o.json.gz").exists())
+        index = json.loads((out / SEARCH_DIR / SEARCH_INDEX_NAME).read_text())
+        self.assertEqual(index["pages"], [["/", "Home"], ["/blog/", "Blog"]])
+        self.assertEqual(index["shards"], [["h", "h", "h.json"], ["t", "t", "t.json"]])
+        self.assertIsNone(index["stem"])
+        self.assertEqual(json.loads((out / SEARCH_DIR / "t.json").read_text()), {"tolkien": [[1, 3], [0, 1]]})
+
+    def test_index_leaves_search_page_alone(self):
+        content, out = self.root / "content", self.root / "docs"
+        (content / "search").mkdir(parents=True)
+        out.mkdir()
+        (content / "index.md").write_text("# Home\n\nHobbits live here")
+        (content / "search" / "index.md").write_text("# Search\n\nFind hobbits")
+        template = self.root / "template.html"
+        template.write_text("{{ Content }}")
+        manifest = BuildManifest.load(self.root / "manifest.json")
+        options = RenderOptions(search_index=True)
+        for _ in range(2):
+            manifest.start_build()
+            summary = generate_page_recursive(content, template, out, "/", manifest, options=options)
+            write_search_index(summary.documents, out)
+            self.assertTrue((out / SEARCH_DIR / "index.html").is_file())
+        self.assertEqual(summary.pages_skipped, 2)
+
+    def test_skipped_pages_stay_in_the_index(self):
+        content, out = self.root / "content", self.root / "docs"
+        (content / "blog").mkdir(parents=True)
+        out.mkdir()
+        (content / "index.md").write_text("# Home\n\nHobbits live here")
+        (content / "blog" / "index.md").write_text("# Blog\n\nAbout hobbits")
+        template = self.root / "template.html"
+        template.write_text("{{ Content }}")
+        manifest = BuildManifest.load(self.root / "manifest.json")
+        options = RenderOptions(search_index=True, search_stem=True)
+        first = generate_page_recursive(content, template, out, "/site/", manifest, options=options)
+        self.assertEqual(first.documents["/site/blog/"], {"title": "Blog", "terms": {"blog": 3, "about": 1,
+                                                                                     "hobbit": 1}})
+        (content / "index.md").write_text("# Home\n\nHobbits lived here")
+        manifest.start_build()
+        second = generate_page_recursive(content, template, out, "/site/", manifest, options=options)
+        self.assertEqual(second.pages_skipped, 1)
+        self.assertEqual(second.documents["/site/blog/"], first.documents["/site/blog/"])
+        self.assertIn("liv", second.documents["/site/"]["terms"])
+
+class TestProfiler(unittest.TestCase):
+    def test_generate_page_records_stages(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            source = root / "index.md"
+            source.write_text("# Title\n\nSome **text**")
+            template = root / "template.html"
+            template.write_text("{{ Title }}{{ Content }}")
+            profiler = BuildProfiler()
+            generate_page(source, template, root / "index.html", "/", profiler=profiler)
+            self.assertEqual(
+                set(profiler.pages[str(source)]),
+                {"read", "block split", "inline parse", "serialize", "template", "write"},
+            )
+            self.assertEqual((root / "index.html").read_text(), "Title<div><h1>Title</h1><p>Some <b>text</b></p></div>")
+
+    def test_merge_and_slowest(self):
+        profiler = BuildProfiler()
+        profiler.record("a.md", "read", 0.5, 3)
+        profiler.merge({"b.md": {"read": {"seconds": 2.0, "blocks": 1}},
+                        "a.md": {"write": {"seconds": 0.25, "blocks": 0}}})
+        with profiler.stage("static copy"):
+            pass
+        self.assertEqual(profiler.slowest_pages(1), ["b.md"])
+        report = profiler.report()
+        self.assertEqual(report["pages"]["a.md"]["seconds"], 0.75)
+        self.assertEqual(report["stages"]["read"], {"seconds": 2.5, "blocks": 4})
+        self.assertIn(SITE, report["pages"])
+
+    def test_stages_in_threads_take_turns(self):
+        # a stage's allocated blocks must not include another thread's
+        profiler = BuildProfiler()
+        inside = []
+        overlaps = []
+
+        def run(page):
+            for _ in range(20):
+                with profiler.stage("read", page):
+                    overlaps.append(bool(inside))
+                    inside.append(page)
+                    time.sleep(0.001)
+                    inside.remove(page)
+
+        threads = [threading.Thread(target=run, args=(f"{i}.md",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(overlaps), 80)
+        self.assertFalse(any(overlaps))
+
+class TestSharding(unittest.TestCase):
+    MAIN = Path(__file__).resolve().parent / "main.py"
+
+    def run_main(self, root, *args):
+        return subprocess.Popen([sys.executable, str(self.MAIN), *args], cwd=root,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def test_page_shard_is_stable(self):
+        shards = [page_shard(Path(f"content/p{i}/index.md"), Path("content"), 4) for i in range(40)]
+        self.assertEqual(shards, [page_shard(Path(f"content/p{i}/index.md"), "content", 4) for i in range(40)])
+        self.assertEqual(set(shards), {0, 1, 2, 3})
+
+    def test_shards_merge_into_full_build(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = Path(tmp)
+            generate_corpus(root, CorpusSpec(pages=20, blocks=4, seed=5))
+            full = self.run_main(root, "build", "--output", "full", "/base/")
+            shards = [self.run_main(root, "build", "--shard", f"{i}/3", "/base/") for i in (1, 2, 3)]
+            for process in [full, *shards]:
+                self.assertEqual(process.wait(), 0, process.stderr.read())
+            merge = self.run_main(root, "merge", *(f".cache/shards/{i}-of-3" for i in (1, 2, 3)))
+            self.assertEqual(merge.wait(), 0, merge.stderr.read())
+
+            def tree(directory):
+                return {p.relative_to(directory): p.read_bytes() for p in directory.rglob("*") if p.is_file()}
+            self.assertEqual(tree(root / "docs"), tree(root / "full"))
+            for process in [full, *shards, merge]:
+                process.stderr.close()
+
+class TestBenchCorpus(unittest.TestCase):
+    def test_corpus_is_deterministic_and_parses(self):
+        spec = CorpusSpec(pages=8, blocks=6, seed=3)
+        with tempfile.TemporaryDirectory() as a, tempfile.TemporaryDirectory() as b:
+            first = generate_corpus(a, spec)
+            second = generate_corpus(b, spec)
+            self.assertEqual(len(first), 8 + 10)
+            self.assertEqual([p.read_text() for p in first], [p.read_text() for p in second])
+            for path in first:
+                source = path.read_text()
+                self.assertTrue(extract_title(source))
+                markdown_to_html_node(source).to_html()
+
+    def test_plain_run_does_not_gate_on_the_baseline(self):
+        ran = []
+        benchmarks = {name: (lambda args, name=name: ran.append(name) or 0) for name in bench.BENCHMARKS}
+        with unittest.mock.patch.dict(bench.BENCHMARKS, benchmarks), contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(bench.main([]), 0)
+        self.assertEqual(ran, ["inline", "memory"])
+
+    def test_missing_or_foreign_baseline_is_not_a_pass(self):
+        spec = CorpusSpec(pages=8)
+        results = {"main() build": 100.0}
+        with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+            baseline = Path(tmp) / "bench_baseline.json"
+            self.assertIsNone(compare_to_baseline(results, spec, baseline, 0.25))
+            baseline.write_text(json.dumps({"corpus": CorpusSpec(pages=9).as_dict(), "pages_per_sec": results}))
+            self.assertIsNone(compare_to_baseline(results, spec, baseline, 0.25))
+            baseline.write_text(json.dumps({"corpus": spec.as_dict(), "pages_per_sec": {"main() build": 200.0}}))
+            self.assertEqual(compare_to_baseline(results, spec, baseline, 0.25), ["main() build"])
+
 if __name__ == "__main__":
     unittest.main()
-
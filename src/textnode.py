@@ -9,9 +9,12 @@ class TextType(Enum):
     IMAGE = "image"
 
 class TextNode:
+    __slots__ = ("text", "text_type", "url")
+
     def __init__(self, text: str, text_type: TextType, url: str = None):
         self.text = text
-        self.text_type = TextType(text_type)
+        # the tokenizer always passes a TextType, so only coerce raw values
+        self.text_type = text_type if type(text_type) is TextType else TextType(text_type)
         self.url = url
 
     def __eq__(self, other):
@@ -1,24 +1,75 @@
 from htmlnode import *
 from textnode import *
+import json
 import re
 
+INLINE_TEXT_TYPES = {
+    "bold": TextType.BOLD,
+    "italic": TextType.ITALIC,
+    "code": TextType.CODE,
+}
+
+# ![rick roll](https://i.imgur.com/aKaOqIh.gif) and [to boot dev](https://www.boot.dev),
+# each matched as one (text, url) pair so stray brackets can't misalign them;
+# the text can't hold "[", or "a [ note ![x](/y)" would read as one link
+IMAGE_RE = re.compile(r"!\[([^\[\]]*)\]\(([^)]*)\)")
+LINK_RE = re.compile(r"(?<!!)\[([^\[\]]*)\]\(([^)]*)\)")
+# text without any of these characters has no inline markup at all
+INLINE_MARKER_RE = re.compile(r"[*_`\[!]")
+
 def extract_markdown_images(text: str):
-    # ![rick roll](https://i.imgur.com/aKaOqIh.gif)
-    alt_text_regex = r"\!\[.*?\]"
-    url_regex = r"\(.*?\)"
-    alt_texts = list(map(lambda s: s[2:-1],re.findall(alt_text_regex, text)))
-    urls = list(map(lambda s: s[1:-1],re.findall(url_regex, text)))
-    return list(zip(alt_texts, urls))
+    return IMAGE_RE.findall(text)
 
 def extract_markdown_links(text: str):
-    # [to boot dev](https://www.boot.dev)
-    desc_regex = r"\[.*?\]"
-    url_regex = r"\(.*?\)"
-    descs = list(map(lambda s: s[1:-1], re.findall(desc_regex, text)))
-    urls = list(map(lambda s: s[1:-1], re.findall(url_regex, text)))
-    return list(zip(descs, urls))
-
-def text_node_to_html_node(text_node: TextNode):
+    return LINK_RE.findall(text)
+
+def has_inline_markup(text: str):
+    return INLINE_MARKER_RE.search(text) is not None
+
+class UrlResolver:
+    """
+    Maps root-relative urls such as "/images/tom.png" onto the site's
+    basepath, and onto the asset's fingerprinted name when fingerprints
+    (see fingerprint.AssetFingerprints) are given. Any other url is
+    returned unchanged. With images (see images.ResponsiveImages) it also
+    knows the size and srcset of the images it resolves.
+    """
+    __slots__ = ("basepath", "fingerprints", "images")
+
+    def __init__(self, basepath: str = "/", fingerprints=None, images=None):
+        self.basepath = basepath
+        self.fingerprints = fingerprints
+        self.images = images
+
+    def __call__(self, url: str):
+        if url.startswith("/") and not url.startswith("//"):
+            path = url[1:]
+            if self.fingerprints is not None:
+                name = path.split("?", 1)[0].split("#", 1)[0]
+                path = self.fingerprints.get(name, name) + path[len(name):]
+            return self.basepath + path
+        return url
+
+    def image_attributes(self, url: str):
+        """The extra attributes of an img showing url: width, height and srcset, if known."""
+        if self.images is None or not url.startswith("/") or url.startswith("//"):
+            return {}
+        return self.images.attributes(url[1:].split("?", 1)[0], lambda name: self.basepath + name)
+
+    def cache_key(self, markdown: str):
+        # parsed trees depend on the resolver, so it is part of cache keys;
+        # of the fingerprints and image sizes, only those of the urls the
+        # markdown uses, so a new asset elsewhere keeps its entry valid
+        key = f"basepath={self.basepath}"
+        if self.fingerprints is None and self.images is None:
+            return key
+        resolved = {}
+        for _, url in extract_markdown_images(markdown) + extract_markdown_links(markdown):
+            if url.startswith("/") and not url.startswith("//"):
+                resolved[url] = [self(url), self.image_attributes(url)]
+        return key + ";assets=" + json.dumps(resolved, sort_keys=True)
+
+def text_node_to_html_node(text_node: TextNode, resolve_url=None):
     match text_node.text_type:
         case TextType.TEXT:
             return LeafNode(None, text_node.text)
@@ -29,9 +80,15 @@ def text_node_to_html_node(text_node: TextNode):
         case TextType.CODE:
             return LeafNode("code", text_node.text)
         case TextType.LINK:
-            return LeafNode("a", text_node.text, {"href": text_node.url})
+            url = resolve_url(text_node.url) if resolve_url else text_node.url
+            return LeafNode("a", text_node.text, {"href": url})
         case TextType.IMAGE:
-            return LeafNode("img", "", {"src": text_node.url, "alt": text_node.text})
+            url = resolve_url(text_node.url) if resolve_url else text_node.url
+            props = {"src": url, "alt": text_node.text}
+            image_attributes = getattr(resolve_url, "image_attributes", None)
+            if image_attributes is not None:
+                props.update(image_attributes(text_node.url))
+            return LeafNode("img", "", props)
         case _:
             raise Exception("Invalid text type provided")
         
@@ -57,7 +114,7 @@ def split_nodes_delimiter(old_nodes: list, delimiter: str, text_type: TextType):
                 new_nodes.append(node)
     return new_nodes
 
-def split_nodes_image(old_nodes):
+def split_nodes_pattern(old_nodes: list, pattern: re.Pattern, text_type: TextType):
     new_nodes = []
     for node in old_nodes:
         if not node.text:
@@ -65,45 +122,61 @@ def split_nodes_image(old_nodes):
         if node.text_type != TextType.TEXT:
             new_nodes.append(node)
             continue
-        images = extract_markdown_images(node.text)
-        if len(images) < 1:
-            new_nodes.append(node)
-            continue
-        alt_text, url = images[0]
-        sections = node.text.split(f"![{alt_text}]({url})",1)
-        if sections[0]:
-            new_nodes.append(TextNode(sections[0], TextType.TEXT))
-        new_nodes.append(TextNode(alt_text, TextType.IMAGE, url))
-        if sections[1]:
-            new_nodes.extend(split_nodes_image([TextNode(sections[1], TextType.TEXT)]))
+        pos = 0
+        for match in pattern.finditer(node.text):
+            if match.start() > pos:
+                new_nodes.append(TextNode(node.text[pos:match.start()], TextType.TEXT))
+            new_nodes.append(TextNode(match[1], text_type, match[2]))
+            pos = match.end()
+        if pos < len(node.text):
+            new_nodes.append(TextNode(node.text[pos:], TextType.TEXT) if pos else node)
     return new_nodes
 
+def split_nodes_image(old_nodes):
+    return split_nodes_pattern(old_nodes, IMAGE_RE, TextType.IMAGE)
+
 def split_nodes_link(old_nodes):
-    new_nodes = []
-    for node in old_nodes:
-        if not node.text:
-            continue
-        if node.text_type != TextType.TEXT:
-            new_nodes.append(node)
-            continue
-        links = extract_markdown_links(node.text)
-        if len(links) < 1:
-            new_nodes.append(node)
-            continue
-        title, url = links[0]
-        sections = node.text.split(f"[{title}]({url})",1)
-        if sections[0]:
-            new_nodes.append(TextNode(sections[0], TextType.TEXT))
-        new_nodes.append(TextNode(title, TextType.LINK, url))
-        if sections[1]:
-            new_nodes.extend(split_nodes_link([TextNode(sections[1], TextType.TEXT)]))
-    return new_nodes
+    return split_nodes_pattern(old_nodes, LINK_RE, TextType.LINK)
+
+# one alternation for every inline construct; finditer takes the leftmost
+# match so the text is scanned once, left to right. Link and alt text can't
+# hold "[", so a stray bracket never swallows the image that follows it.
+INLINE_RE = re.compile(
+    r"\*\*(?P<bold>.*?)\*\*"
+    r"|_(?P<italic>.*?)_"
+    r"|`(?P<code>.*?)`"
+    r"|!\[(?P<alt>[^\[\]]*)\]\((?P<src>[^)]*)\)"
+    r"|\[(?P<title>[^\[\]]*)\]\((?P<href>[^)]*)\)",
+    re.DOTALL,
+)
+
+UNMATCHED_DELIMITERS = ("**", "_", "`")
+
+def plain_text_node(text: str):
+    for delimiter in UNMATCHED_DELIMITERS:
+        if delimiter in text:
+            raise Exception("missing trailing delimeter on node")
+    return TextNode(text, TextType.TEXT)
 
 def text_to_textnodes(text: str):
-    node = TextNode(text, TextType.TEXT)
-    nodes = split_nodes_delimiter([node], "**", TextType.BOLD)
-    nodes = split_nodes_delimiter(nodes, "_", TextType.ITALIC)
-    nodes = split_nodes_delimiter(nodes, "`", TextType.CODE)
-    nodes = split_nodes_image(nodes)
-    nodes = split_nodes_link(nodes)
+    if not has_inline_markup(text):
+        # most prose never reaches the tokenizer
+        return [TextNode(text, TextType.TEXT)] if text else []
+    nodes = []
+    pos = 0
+    for match in INLINE_RE.finditer(text):
+        if match.start() > pos:
+            nodes.append(plain_text_node(text[pos:match.start()]))
+        pos = match.end()
+        match match.lastgroup:
+            case "bold" | "italic" | "code" as kind:
+                # empty spans such as "****" produce no node
+                if match[kind]:
+                    nodes.append(TextNode(match[kind], INLINE_TEXT_TYPES[kind]))
+            case "src":
+                nodes.append(TextNode(match["alt"], TextType.IMAGE, match["src"]))
+            case "href":
+                nodes.append(TextNode(match["title"], TextType.LINK, match["href"]))
+    if pos < len(text):
+        nodes.append(plain_text_node(text[pos:]))
     return nodes
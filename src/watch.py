@@ -0,0 +1,324 @@
+from build import *
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05
+# editors often save in several steps (write, rename, chmod), so wait this
+# long for the burst of events to finish before rebuilding
+SETTLE_DELAY = 0.01
+RELOAD_TIMEOUT = 25
+
+RELOAD_PATH = "/__livereload"
+RELOAD_SCRIPT = """<script>
+(function poll(version) {{
+  fetch("{path}?v=" + version)
+    .then(function (r) {{ return r.text(); }})
+    .then(function (v) {{ v === String(version) ? poll(version) : location.reload(); }},
+          function () {{ setTimeout(function () {{ poll(version); }}, 1000); }});
+}})({version});
+</script>"""
+
+def snapshot(roots: list):
+    files = {}
+    for root in roots:
+        root = Path(root)
+        paths = [root] if root.is_file() else root.rglob("*")
+        for path in paths:
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            if not path.is_dir():
+                files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+class PollingWatcher:
+    def __init__(self, roots: list, interval: float = POLL_INTERVAL):
+        self.roots = roots
+        self.interval = interval
+        self.files = snapshot(roots)
+
+    def wait(self):
+        """Block until something changes and return the changed paths."""
+        while True:
+            time.sleep(self.interval)
+            current = snapshot(self.roots)
+            changed = {path for path in current.keys() | self.files.keys()
+                       if current.get(path) != self.files.get(path)}
+            self.files = current
+            if changed:
+                return changed
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+class InotifyWatcher:
+    """
+    Linux inotify through libc. Every directory under the watched roots gets
+    a watch, and directories created later are added as they appear.
+    """
+    def __init__(self, roots: list):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.roots = [Path(root) for root in roots]
+        self.dirs = {}
+        for root in self.roots:
+            if root.is_dir():
+                self.watch_tree(root)
+            else:
+                # single files (template.html) are watched through their directory
+                self.watch_dir(root.parent)
+
+    def watch_dir(self, path: Path):
+        wd = self._add_watch(self.fd, os.fsencode(path), INOTIFY_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"cannot watch {path}")
+        self.dirs[wd] = path
+
+    def watch_tree(self, root: Path):
+        self.watch_dir(root)
+        for path in root.rglob("*"):
+            if path.is_dir():
+                self.watch_dir(path)
+
+    def is_watched(self, path: Path):
+        return any(path == root or root in path.parents for root in self.roots)
+
+    def read_events(self):
+        changed = set()
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # events were dropped; report the roots so everything is rebuilt
+                changed.update(self.roots)
+                continue
+            directory = self.dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = directory / os.fsdecode(name)
+            if not self.is_watched(path):
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self.watch_tree(path)
+                changed.update(p for p in path.rglob("*") if p.is_file())
+            changed.add(path)
+        return changed
+
+    def wait(self):
+        """Block until something changes and return the changed paths."""
+        changed = set()
+        while not changed:
+            changed |= self.read_events()
+            while select.select([self.fd], [], [], SETTLE_DELAY)[0]:
+                changed |= self.read_events()
+        return changed
+
+def make_watcher(roots: list):
+    roots = [root for root in roots if Path(root).exists()]
+    try:
+        return InotifyWatcher(roots)
+    except (OSError, AttributeError, TypeError):
+        # no inotify (not Linux, or out of watches): fall back to polling
+        return PollingWatcher(roots)
+
+class LiveReload:
+    """A build counter that browsers long-poll until it moves on."""
+    def __init__(self):
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def bump(self):
+        with self.changed:
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait(self, since: int, timeout: float = RELOAD_TIMEOUT):
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != since, timeout)
+            return self.version
+
+class LiveReloadHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, reload: LiveReload = None, **kwargs):
+        self.reload = reload
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == RELOAD_PATH:
+            since = int(parse_qs(url.query).get("v", ["-1"])[0])
+            self.send_body(str(self.reload.wait(since)).encode(), "text/plain")
+            return
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and url.path.endswith("/"):
+            path = os.path.join(path, "index.html")
+        if path.endswith(".html") and os.path.isfile(path):
+            with open(path, "rb") as f:
+                body = f.read()
+            script = RELOAD_SCRIPT.format(path=RELOAD_PATH, version=self.reload.version).encode()
+            end = body.rfind(b"</body>")
+            body = body[:end] + script + body[end:] if end != -1 else body + script
+            self.send_body(body, "text/html; charset=utf-8")
+            return
+        super().do_GET()
+
+    def send_body(self, body: bytes, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.path.startswith(RELOAD_PATH):
+            super().log_message(format, *args)
+
+def serve(directory: Path, port: int, reload: LiveReload):
+    handler = partial(LiveReloadHandler, directory=str(directory), reload=reload)
+    server = ThreadingHTTPServer(("", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class SiteWatcher:
+    """
+    Keeps docs/ up to date while content/, static/ and the templates are
+    edited. Single page and static file edits are rebuilt on their own;
+    template, nav and directory changes fall back to an incremental build.
+    """
+    def __init__(self, basepath: str = "/", workers: int = 1, cache: ASTCache = None,
+                 output_dir: Path = OUTPUT_DIR, copy_mode: str = "copy", options: RenderOptions = None):
+        self.basepath = basepath
+        self.options = options
+        self.copy_mode = copy_mode
+        self.workers = workers
+        self.cache = cache
+        self.output_dir = Path(output_dir)
+        self.manifest = BuildManifest.load(MANIFEST_PATH)
+        self.nav = None
+
+    def full_build(self):
+        summary = build_site(self.basepath, self.manifest, self.workers, self.cache, self.output_dir, self.copy_mode,
+                             options=self.options)
+        logger.info("%s", summary)
+        self.nav = build_nav(CONTENT_DIR, UrlResolver(self.basepath))
+
+    def rebuild(self, changed: set):
+        pages = []
+        for path in sorted(changed):
+            if path.name == TEMPLATE_PATH.name or path.is_dir() or path in (CONTENT_DIR, STATIC_DIR):
+                self.full_build()
+                return
+            if STATIC_DIR in path.parents:
+                self.sync_asset(path)
+                # pages embedding or linking to the file
+                pages.extend(Path(source) for source in self.manifest.dependents(path))
+            elif CONTENT_DIR in path.parents and path.suffix == ".md":
+                pages.append(path)
+                if not path.exists() or str(path) not in self.manifest.pages:
+                    # links to the page now work or now break
+                    pages.extend(Path(source) for source in self.manifest.dependents(path))
+            elif CONTENT_DIR in path.parents and not path.exists():
+                # most likely a removed directory; let the manifest clean up
+                self.full_build()
+                return
+
+        nav = build_nav(CONTENT_DIR, UrlResolver(self.basepath))
+        if nav != self.nav:
+            # a section was added, removed or retitled: only pages showing the nav change
+            self.nav = nav
+            pages.extend(self.nav_pages())
+        if pages:
+            self.manifest.start_build()
+            for path in sorted(set(pages)):
+                self.rebuild_page(path)
+            self.manifest.save()
+
+    def nav_pages(self):
+        """Sources of every page whose template has a {{ Nav }} slot."""
+        return [source for source in sorted(CONTENT_DIR.rglob("*.md"))
+                if "Nav" in load_template(find_template(source, CONTENT_DIR, TEMPLATE_PATH), self.basepath).slots]
+
+    def rebuild_page(self, source: Path):
+        dest = self.output_dir / source.relative_to(CONTENT_DIR).with_suffix(".html")
+        if not source.exists():
+            dest.unlink(missing_ok=True)
+            self.manifest.pages.pop(str(source), None)
+            return
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        template_path = find_template(source, CONTENT_DIR, TEMPLATE_PATH)
+        values = {"Nav": self.nav}
+        inputs = tracked_inputs(self.manifest, source, template_path, self.basepath, values,
+                                options=self.options)
+        reason = self.manifest.rebuild_reason(source, dest, inputs) or "changed while watching"
+        generate_page(source, template_path, dest, self.basepath, self.cache, values, skip_unchanged=True,
+                      options=self.options)
+        self.manifest.record(source, dest, inputs, reason=reason)
+
+    def sync_asset(self, source: Path):
+        relative = source.relative_to(STATIC_DIR)
+        dest = self.output_dir / relative
+        if source.is_file():
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            copy_file(source, dest, self.copy_mode)
+            if relative.as_posix() not in self.manifest.assets:
+                self.manifest.assets.append(relative.as_posix())
+        elif dest.is_dir():
+            shutil.rmtree(dest)
+        else:
+            remove_output(self.output_dir, dest)
+            if relative.as_posix() in self.manifest.assets:
+                self.manifest.assets.remove(relative.as_posix())
+
+def watch_site(basepath: str = "/", port: int = 8888, workers: int = 1, cache: ASTCache = None,
+               copy_mode: str = "copy", options: RenderOptions = None):
+    site = SiteWatcher(basepath, workers, cache, copy_mode=copy_mode, options=options)
+    site.full_build()
+    reload = LiveReload()
+    server = serve(site.output_dir, port, reload)
+    watcher = make_watcher([CONTENT_DIR, STATIC_DIR, TEMPLATE_PATH])
+    logger.info("Serving %s at http://localhost:%d/ (%s)", site.output_dir, port, type(watcher).__name__)
+    try:
+        while True:
+            changed = watcher.wait()
+            start = time.perf_counter()
+            try:
+                site.rebuild(changed)
+            except Exception as e:
+                logger.error("Rebuild failed: %s: %s", type(e).__name__, e)
+                continue
+            reload.bump()
+            logger.info("Rebuilt %d change(s) in %.0f ms", len(changed), (time.perf_counter() - start) * 1000)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()